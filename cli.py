@@ -29,6 +29,11 @@ def main(argv=sys.argv):  # pylint: disable=W0102
         action="store_true",
         help="Update all feeds",
     )
+    parser.add_argument(
+        "-D", "--daemon",
+        action="store_true",
+        help="Update feeds continuously, each at its own pace",
+    )
     parser.add_argument(
         "-r", "--rubric",
         type=str,
@@ -46,20 +51,61 @@ def main(argv=sys.argv):  # pylint: disable=W0102
         action="store_true",
         help="Disable logging",
     )
+    parser.add_argument(
+        "-i", "--init-db",
+        action="store_true",
+        help="Create database indexes",
+    )
     parser.add_argument(
         "-p", "--purge-cache",
         action="store_true",
-        help="Purge rubrics cache",
+        help="Purge outdated rubrics cache",
+    )
+    parser.add_argument(
+        "-t", "--trim",
+        action="store_true",
+        help="Remove entries beyond retention limits",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Fix, clean and classify all entries again, once after upgrading",
+    )
+    parser.add_argument(
+        "--render-all",
+        action="store_true",
+        help="Render all rubrics to static files in one pass",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        metavar="DIR",
+        help="Directory for --render-all",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write gzipped copies with --render-all",
+    )
+    parser.add_argument(
+        "-s", "--serve",
+        type=str,
+        metavar="[HOST:]PORT",
+        help="Serve feeds over HTTP with the development server",
     )
     args = parser.parse_args(argv[1:])
 
+    if args.render_all and not args.out:
+        parser.error("--render-all requires --out")
+
     logging.basicConfig(
         level=logging.WARNING,
         format="%(asctime)s : %(process)d : %(levelname)s : %(message)s",
         filename="/dev/null" if args.no_log else "/var/log/dinase.log",
     )
 
-    if args.update_all or args.delete or args.purge_cache:
+    if args.update_all or args.daemon or args.delete or args.purge_cache or \
+            args.rebuild or args.init_db or args.trim:
         lock = unixfilelock.UnixFileLock("/run/lock/dinase.lock")
 
         try:
@@ -68,10 +114,22 @@ def main(argv=sys.argv):  # pylint: disable=W0102
             print("{}: locked by other process".format(argv[0]))
             return 0
 
+        if args.init_db:
+            from dinase.model import init
+            init()
+
         if args.purge_cache:
             from dinase.model import Entries
             Entries.purge_cache()
 
+        if args.rebuild:
+            from dinase.model import Entries
+            Entries.rebuild()
+
+        if args.trim:
+            from dinase.model import Entries
+            Entries.trim()
+
         if args.delete:
             if args.rubric:
                 from dinase.model import Entries
@@ -79,21 +137,43 @@ def main(argv=sys.argv):  # pylint: disable=W0102
 
             else:
                 from dinase.model import drop
+                from dinase.versions import bump_all
                 drop()
+                bump_all()
+
+        def on_feed_updated(name, success, info):  # pylint: disable=W0613
+            print("{}: {}".format(name, info))
 
         if args.update_all:
             from dinase.updater import update
 
-            def on_feed_updated(name, success, info):  # pylint: disable=W0613
-                print("{}: {}".format(name, info))
+            for stage in update(callback=on_feed_updated):
+                print("stage {name}: {count} done, {throughput:.2f}/s, "
+                      "max queue depth {max_depth}, {errors} failed, "
+                      "{dropped} dropped".format(**stage))
 
-            update(callback=on_feed_updated)
+        if args.daemon:
+            from dinase.scheduler import run
+            run(callback=on_feed_updated)
 
         lock.release()
 
+    if args.render_all:
+        from dinase.feed import render_all
+        render_all(args.out, gzip=args.gzip)
+
+    if args.serve:
+        from dinase.wsgi import serve
+
+        host, _, port = args.serve.rpartition(":")
+        serve(host or "127.0.0.1", int(port))
+
     if args.rubric and not args.delete:
-        from dinase.feed import get_feed
-        sys.stdout.write(get_feed(args.rubric))
+        from dinase.feed import iter_feed
+
+        for chunk in iter_feed(args.rubric):
+            sys.stdout.write(chunk)
+
         sys.stdout.flush()
 
 
@@ -4,13 +4,10 @@
 from __future__ import absolute_import
 
 import sys
-import os
-import urlparse
 import logging
+from wsgiref.handlers import CGIHandler
 
-import trafaret as t
-
-from dinase.feed import get_feed
+from dinase.wsgi import application
 
 
 def main(argv=sys.argv):  # pylint: disable=W0102,W0613
@@ -20,14 +17,7 @@ def main(argv=sys.argv):  # pylint: disable=W0102,W0613
         level=logging.WARNING
     )
 
-    query = urlparse.parse_qsl(os.environ.get("QUERY_STRING", ""))
-    args = t.Dict({
-        t.Key("r"): t.String
-    }).check(dict(query))
-
-    sys.stdout.write("Content-type:application/atom+xml;charset=utf-8\n\n")
-    sys.stdout.write(get_feed(args["r"]))
-    sys.stdout.flush()
+    CGIHandler().run(application)
 
 
 if __name__ == "__main__":
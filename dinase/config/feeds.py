@@ -15,6 +15,8 @@ feeds = t.Dict({
         t.Key("url"): t.String,
         t.Key("usertags", optional=True): t.List(t.String),
         t.Key("disable", default=False): t.Bool,
+        t.Key("min_interval", optional=True): t.Int(gt=0),
+        t.Key("max_interval", optional=True): t.Int(gt=0),
         t.Key("replace", optional=True): t.Dict({
             t.Key("title", optional=True): t.String,
             t.Key("subtitle", optional=True): t.String,
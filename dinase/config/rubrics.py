@@ -2,6 +2,8 @@
 
 from __future__ import unicode_literals
 
+import hashlib
+import json
 import logging
 import trafaret as t
 
@@ -18,16 +20,46 @@ __all__ = ("rubrics", )
 class Rule(object):
 
     _compile = PredicateCompiler(filters).compile
+    _names = PredicateCompiler(filters).names
 
     def __init__(self, source):
         super(Rule, self).__init__()
 
         self._source = source
+        self._rule = None
+        self._filters = [filters[name] for name in sorted(set(self._names(source)))
+                         if name in filters]
+        self.keys = frozenset().union(*[filter_.keys for filter_ in self._filters])
+        self.timed = any(filter_.timed for filter_ in self._filters)
+        self.fingerprint = self._get_fingerprint(source)
 
-    def __call__(self, *args, **kwargs):  # pylint: disable=E0202
-        rule = self.__call__ = self._compile(self._source)
+    def __call__(self, *args, **kwargs):
+        # NOTE: special methods are looked up on the type, so the compiled
+        # rule is kept in an attribute instead of replacing __call__
+        if self._rule is None:
+            self._rule = self._compile(self._source)
 
-        return rule(*args, **kwargs)
+        return self._rule(*args, **kwargs)
+
+    def expires(self, item, now=None):
+        """Return the timestamp when the rule result may change or None."""
+
+        moments = [filter_.expires(item, now) for filter_ in self._filters]
+        moments = [moment for moment in moments if moment is not None]
+
+        return min(moments) if moments else None
+
+    @classmethod
+    def _get_fingerprint(cls, source):
+        sha1 = hashlib.sha1(source.encode("utf-8"))
+
+        for name in sorted(set(cls._names(source))):
+            filter_ = filters.get(name)
+            definition = filter_.source if filter_ is not None else None
+            sha1.update(name.encode("utf-8"))
+            sha1.update(json.dumps(definition, sort_keys=True).encode("utf-8"))
+
+        return sha1.hexdigest()
 
 
 class Rubrics(dict):
@@ -37,6 +69,7 @@ class Rubrics(dict):
         for name, rubric in iteritems(self):
             rubric["name"] = name
             rubric["rule"] = Rule(rubric["rule"])
+            rubric["token"] = "{}@{}".format(name, rubric["rule"].fingerprint[:12])
 
     def __missing__(self, key):  # pylint: disable=R0201
         exc_text = "rubric '{}' not found".format(key)
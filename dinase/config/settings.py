@@ -7,4 +7,13 @@ from dinaseconfig import (
     LINK_MASK,
     JSON_DIR,
     PROCESS_COUNT,
+    FETCH_CONCURRENCY,
+    FETCH_PER_HOST,
+    STORE_CONCURRENCY,
+    QUEUE_SIZE,
+    UPDATE_TIMEOUT,
+    REDIRECTS,
+    SCHEDULER,
+    RETENTION,
+    RENDER_CACHE,
 )
@@ -7,7 +7,7 @@ import dateutil.parser
 from dinase.sugar.future import string_types
 from dinase.sugar.future import default_integer_type as int
 
-from .const import SECONDS_IN_HOUR
+from .const import SECONDS_IN_HOUR, SECONDS_IN_DAY, HOURS_IN_DAY
 from .convert import to_timestamp
 from .standard import xsd, rfc2822, rfc822
 
@@ -113,7 +113,7 @@ class xsd(_DateTimeBase):
         dt = datetime.datetime.strptime(parsed.group("datetime"), "%Y-%m-%dT%H:%M:%S")
 
         if parsed.group("milliseconds") is not None:
-            dt = dt.replace(milliseconds=int(parsed.group("milliseconds")))
+            dt = dt.replace(microsecond=int(parsed.group("milliseconds").ljust(6, "0")[:6]))
 
         if parsed.group("offset") is None:
             return dt
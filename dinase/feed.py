@@ -2,58 +2,328 @@
 
 from __future__ import unicode_literals
 
-from dinase.sugar.dict import iteritems
+import datetime
+import errno
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import urllib
+import zlib
+from contextlib import closing
 
-from .config import LINK_MASK, rubrics
-from .model import Heads, Entries
-from .feedlib import get_atom, fix_head
+from dateutil.tz import tzlocal
+
+from dinase.sugar.fs import open_atomic, write_atomic
+
+from . import versions
+from .config import LINK_MASK, PROCESS_COUNT, RENDER_CACHE, rubrics
+from .model import Heads, Entries, is_valid_id
+from .feedlib import (
+    get_atom_from_fragments,
+    iter_atom_from_fragments,
+    fix_head,
+    set_author,
+    render_entry,
+)
+
+
+_CHUNK_SIZE = 64 * 1024
+
+_CURSOR_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+_SUFFIXES = {
+    None: ".xml",
+    "gzip": ".xml.gz",
+}
 
 
 def get_feed(rubric):
+    return b"".join(iter_feed(rubric))
+
+
+def iter_feed(rubric):
+    """Yield the encoded feed of a rubric while its entries are selected."""
+
+    head = _generate_head(rubrics[rubric])
+    fragments = (fragment for _, fragment in _iter_fragments(rubric))
+
+    return iter_atom_from_fragments(head, fragments)
+
+
+def get_page(rubric, since=None, before=None, limit=None):
+    """Return a page of the feed with RFC 5005 paging links.
+
+    Since is a datetime, entries added after it are returned, before is a
+    cursor (see parse_cursor) of the previous page. Pages are rendered as a
+    whole, the links follow the last entry.
+    """
+
+    length = rubrics[rubric]["length"]
+    limit = min(limit or length, length)
+
+    fragments = []
+    last = None
+
+    for last, fragment in _iter_fragments(rubric, since, before, limit):
+        fragments.append(fragment)
+
+    query = []
+
+    # NOTE: isoformat keeps microseconds, datelib.xsd.format drops them
+    if since is not None:
+        query.append(("since", since.replace(tzinfo=tzlocal()).isoformat()))
+
+    query.append(("limit", limit))
+
+    links = [("first", query)]
+
+    if len(fragments) == limit:
+        older = query + [("before", format_cursor(last["_added"], last["_id"]))]
+        links.extend([("next", older), ("prev-archive", older)])
+
+    if before is not None:
+        query = query + [("before", format_cursor(*before))]
+
+    head = _generate_head(rubrics[rubric], _get_page_url(rubric, query), [
+        {"rel": rel, "href": _get_page_url(rubric, link_query),
+         "type": "application/atom+xml"}
+        for rel, link_query in links
+    ])
+
+    return get_atom_from_fragments(head, fragments)
+
+
+def render_all(out, names=None, gzip=False):
+    """Write static documents of rubrics to out, <rubric>.xml and with gzip
+    <rubric>.xml.gz too; entries are selected in a single scan."""
+
+    if names is None:
+        names = sorted(rubrics)
+
+    # NOTE: a batch run, unlike a request it may rewrite stale decisions
+    Entries.expire_cache()
+    selected = Entries.select_many(names)
+    heads = {}
+    tasks = [(name, list(_iter_routed(rubrics[name], selected[name], heads)), out, gzip)
+             for name in names]
+
+    pool = multiprocessing.Pool(processes=max(min(PROCESS_COUNT, len(tasks)), 1))
+
+    try:
+        for name in pool.imap_unordered(_write_static, tasks):
+            logging.info("rendered rubric: {}".format(name))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def compress(data):
+    compressor = _get_compressor()
+
+    return compressor.compress(data) + compressor.flush()
+
+
+def format_cursor(added, entry_id):
+    return "{}_{}".format(added.strftime(_CURSOR_FORMAT), entry_id)
+
+
+def parse_cursor(cursor):
+    """Return the (_added, _id) pair of a cursor, ValueError if malformed."""
+
+    added, separator, entry_id = cursor.partition("_")
+
+    if not separator or not is_valid_id(entry_id):
+        raise ValueError("malformed cursor: {}".format(cursor))
+
+    return datetime.datetime.strptime(added, _CURSOR_FORMAT), entry_id
+
+
+def get_feed_version(rubric):
+    """Return the entity tag of a rubric feed and its modification time.
+
+    The tag changes with the rubric entries, rule and template, no database
+    query is made.
+    """
+
+    rubric_name = rubric
+    rubric = rubrics[rubric_name]
+
+    version, mtime = versions.get(rubric_name)
+    signature = json.dumps([rubric["token"], rubric["template"], rubric["length"],
+                            rubric["no_authors"], LINK_MASK], sort_keys=True)
+
+    return "{}-{}".format(version, hashlib.sha1(signature).hexdigest()[:12]), mtime
+
+
+def get_cached_feed(rubric, tag=None, encoding=None):
+    return b"".join(iter_cached_feed(rubric, tag, encoding))
+
+
+def read_cached_feed(rubric, tag, encoding=None):
+    """Return the cached document of a feed version or None."""
+
+    try:
+        with open(_get_cache_path(rubric, tag, encoding), "rb") as fp:
+            return fp.read()
+    except IOError:
+        return None
+
+
+def iter_cached_feed(rubric, tag=None, encoding=None):
+    """Yield the cached document in chunks, on a miss stream the feed
+    while it is written to the cache.
+
+    Encoding is None or "gzip", both are written on a miss, so a version is
+    compressed once.
+    """
+
+    if tag is None:
+        tag = get_feed_version(rubric)[0]
+
+    path = _get_cache_path(rubric, tag, encoding)
+
+    try:
+        fp = open(path, "rb")
+    except IOError:
+        pass
+    else:
+        with fp:
+            for chunk in iter(lambda: fp.read(_CHUNK_SIZE), b""):
+                yield chunk
+
+        return
+
+    compressor = _get_compressor()
+
+    with open_atomic(_get_cache_path(rubric, tag)) as plain_fp, \
+            open_atomic(_get_cache_path(rubric, tag, "gzip")) as gzip_fp:
+        for chunk in iter_feed(rubric):
+            compressed = compressor.compress(chunk)
+            plain_fp.write(chunk)
+            gzip_fp.write(compressed)
+
+            if encoding is None:
+                yield chunk
+
+            elif compressed:
+                yield compressed
+
+        compressed = compressor.flush()
+        gzip_fp.write(compressed)
+
+        if encoding is not None:
+            yield compressed
+
+    # NOTE: "[0-9a-f]" keeps rubrics sharing a name prefix apart
+    pattern = "{}-{}-{}.xml*".format(rubric, "[0-9a-f]" * 32, "[0-9a-f]" * 12)
+    current = {_get_cache_path(rubric, tag), _get_cache_path(rubric, tag, "gzip")}
+
+    for stale in glob.glob(os.path.join(os.path.dirname(path), pattern)):
+        if stale not in current:
+            _remove(stale)
+
+
+def _get_compressor():
+    # NOTE: 16 + MAX_WBITS writes a gzip header and trailer
+    return zlib.compressobj(RENDER_CACHE["GZIP_LEVEL"], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _get_cache_path(rubric, tag, encoding=None):
+    return os.path.join(RENDER_CACHE["DIR"], "feeds", "{}-{}{}".format(
+        rubric, tag, _SUFFIXES[encoding]))
+
+
+def _get_page_url(rubric, query):
+    link = LINK_MASK.format(rubric=rubric)
+
+    if not query:
+        return link
+
+    return "{}{}{}".format(link, "&" if "?" in link else "?", urllib.urlencode(
+        [(key, "{}".format(value).encode("utf-8")) for key, value in query]))
+
+
+def _iter_fragments(rubric, since=None, before=None, limit=None):
     rubric_name = rubric
     rubric = rubrics[rubric_name]
 
     heads = {}
-    entries = []
-    length = rubric["length"]
+    count = 0
+    length = limit or rubric["length"]
     no_authors = rubric["no_authors"]
 
-    for entry in Entries.select(rubric_name):
+    with closing(Entries.select(rubric_name, since, before, limit)) as selected:
+        for entry in selected:
+            feed = entry["_feed"]
+
+            if feed in heads:
+                head = heads[feed]
+
+            else:
+                head = Heads.get(feed)
+
+                if head is None:
+                    continue
+
+                heads[feed] = head
+
+            yield entry, _get_fragment(entry, head, no_authors)
+            count += 1
+
+            if count == length:
+                break
+
+
+def _iter_routed(rubric, entries, heads):
+    for entry in entries:
         feed = entry["_feed"]
 
-        if feed in heads:
-            head = heads[feed]
+        if feed not in heads:
+            heads[feed] = Heads.get(feed)
+
+        if heads[feed] is not None:
+            yield _get_fragment(entry, heads[feed], rubric["no_authors"])
 
-        else:
-            head = Heads.get(feed)
 
-            if head is None:
-                continue
+def _write_static(task):
+    name, fragments, out, gzip = task
+    xml = get_atom_from_fragments(_generate_head(rubrics[name]), fragments)
 
-            heads[feed] = head
+    write_atomic(os.path.join(out, "{}.xml".format(name)), xml)
 
-        if no_authors:
-            if "title" in head:
-                entry["author"] = {
-                    "name": head["title"]["value"],
-                }
+    if gzip:
+        write_atomic(os.path.join(out, "{}.xml.gz".format(name)), compress(xml))
 
-            elif "author" in entry:
-                del entry["author"]
+    return name
 
-        entry = {key: value for key, value in iteritems(entry)
-                 if not key.startswith("_")}
 
-        entries.append(entry)
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
 
-        if len(entries) == length:
-            break
 
-    head = _generate_head(rubric)
-    return get_atom(head, entries)
+def _get_fragment(entry, head, no_authors):
+    # NOTE: entries stored before fragments or rendered without the author
+    # variant are rendered on the fly
+    fragments = entry.get("_atom") or {}
+    variant = "no_authors" if no_authors else "default"
 
+    if variant in fragments:
+        return fragments[variant]
 
-def _generate_head(rubric):
+    if no_authors:
+        set_author(entry, head)
+
+    return render_entry(entry)
+
+
+def _generate_head(rubric, self_link=None, links=()):
     template = rubric["template"]
     link = LINK_MASK.format(rubric=rubric["name"])
 
@@ -75,7 +345,7 @@ def _generate_head(rubric):
     head["links"] = [
         {
             "rel":  "self",
-            "href": link,
+            "href": self_link or link,
             "type": "application/atom+xml"
         }
     ]
@@ -93,4 +363,9 @@ def _generate_head(rubric):
     # TODO: add atom field rubrics
     # TODO: add atom field generator
 
-    return fix_head(head)
+    head = fix_head(head)
+
+    # NOTE: fix_head keeps registered relations only, paging ones go after
+    head["links"].extend(links)
+
+    return head
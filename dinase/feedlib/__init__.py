@@ -3,5 +3,8 @@
 from __future__ import unicode_literals
 
 from .atom import get_xml as get_atom
-from .parse import parse
+from .atom import get_xml_from_fragments as get_atom_from_fragments
+from .atom import iter_xml_from_fragments as iter_atom_from_fragments
+from .parse import parse, fetch, parse_body, NotModified
 from .fixer import fix_head, fix_entry
+from .render import set_author, render_entry, render_fragments
@@ -15,7 +15,7 @@ from dinase.sugar.dict import iteritems
 from .. import datelib
 
 
-__all__ = ("get_xml", )
+__all__ = ("get_xml", "get_entry_xml", "get_xml_from_fragments", "iter_xml_from_fragments")
 
 
 def atomUri(uri):
@@ -708,3 +708,33 @@ def get_xml(head, entries):
     atom = atomFeed(head, entries)
 
     return etree.tostring(atom, xml_declaration=True, encoding="utf-8")
+
+
+def get_entry_xml(entry):
+    # NOTE: the fragment inherits the default namespace of the feed
+    root = etree.Element("root")
+    atomEntry(root, entry)
+
+    return etree.tostring(root[0], encoding="unicode")
+
+
+def get_xml_from_fragments(head, fragments):
+    return b"".join(iter_xml_from_fragments(head, fragments))
+
+
+def iter_xml_from_fragments(head, fragments):
+    """Serialize the feed incrementally, encoded chunks are yielded as the
+    fragments iterable is consumed: the head first, then one per entry."""
+
+    # NOTE: entry fragments are already serialized, so the head element is
+    # written once and split instead of feeding entries to etree.xmlfile,
+    # which would have to parse them back
+    xml = etree.tostring(atomFeed(head, []), encoding="unicode")
+    end = xml.rindex("</feed>")
+
+    yield "<?xml version='1.0' encoding='utf-8'?>\n{}".format(xml[:end]).encode("utf-8")
+
+    for fragment in fragments:
+        yield fragment.encode("utf-8")
+
+    yield xml[end:].encode("utf-8")
@@ -5,10 +5,22 @@ from __future__ import unicode_literals
 from . import url, html
 
 
-def clean(entry):
+def clean(entry, resolve=url.get_location):
+    clean_links(entry, resolve)
+    clean_html(entry)
+
+
+def clean_links(entry, resolve=url.get_location):
     if "links" in entry:
         for link in entry["links"]:
-            link["href"] = url.unproxy(link["href"])
+            link["href"] = url.unproxy(link["href"], resolve)
+
 
+def clean_html(entry):
     if "summary" in entry and entry["summary"]["type"] == "text/html":
         entry["summary"]["value"] = html.clean(entry["summary"]["value"])
+
+
+def get_redirectors(entry):
+    return [link["href"] for link in entry.get("links", [])
+            if url.is_redirector(link["href"])]
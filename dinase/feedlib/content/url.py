@@ -17,8 +17,31 @@ feedsportal_replace = {
     "0Z": "Z"
 }
 
+redirectors = ("feedproxy.google.com", "feeds.feedburner.com")
 
-def unproxy(url):
+
+def get_location(url):
+    grab = Grab(follow_location=False, follow_refresh=False,
+                nobody=True, hammer_mode=True)
+    grab.go(url)
+
+    if grab.response.code not in (301, 302):
+        return url
+
+    if "Location" not in grab.response.headers:
+        return url
+
+    return grab.response.headers["Location"]
+
+
+def is_redirector(url):
+    try:
+        return urlparse(url).netloc in redirectors
+    except ValueError:
+        return False
+
+
+def unproxy(url, resolve=get_location):
     try:
         parsed_url = urlparse(url)
     except ValueError:
@@ -44,20 +67,15 @@ def unproxy(url):
         for x in re.split(r"(0[A-Z])", match.group("url")):
             parts.append(feedsportal_replace.get(x, x))
 
-        return unproxy("".join(parts))
-
-    if netloc in ("feedproxy.google.com", "feeds.feedburner.com"):
-        grab = Grab(follow_location=False, follow_refresh=False,
-                    nobody=True, hammer_mode=True)
-        grab.go(url)
+        return unproxy("".join(parts), resolve)
 
-        if grab.response.code not in (301, 302):
-            return url
+    if netloc in redirectors:
+        location = resolve(url)
 
-        if "Location" not in grab.response.headers:
+        if not location or location == url:
             return url
 
-        return unproxy(grab.response.headers["Location"])
+        return unproxy(location, resolve)
 
     if netloc == "news.yandex.ru":
         params = dict(parse_qsl(parsed_url.query))
@@ -70,6 +88,6 @@ def unproxy(url):
         if not urlparse(cl4url).scheme:
             cl4url = "http://{}".format(cl4url)
 
-        return unproxy(cl4url)
+        return unproxy(cl4url, resolve)
 
     return url
@@ -2,17 +2,68 @@
 
 from __future__ import unicode_literals
 
+import hashlib
+
 import feedparser
 from grab import Grab
 
 from .fixer import fix_head, fix_entries
 
 
+class NotModified(IOError):
+    pass
+
+
 def parse(url):
+    body, _ = fetch(url)
+    return parse_body(body)
+
+
+def fetch(url, validators=None, connect_timeout=None, timeout=None):
+    validators = validators or {}
+    headers = {}
+
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
     grab = Grab(hammer_mode=True)
+    grab.setup(headers=headers)
+
+    if timeout:
+        connect_timeout = connect_timeout or timeout
+
+        # NOTE: hammer mode retries with its own timeouts, limit it to
+        # a single attempt within the budget
+        grab.setup(connect_timeout=connect_timeout, timeout=timeout,
+                   hammer_timeouts=((connect_timeout, timeout), ))
+
     grab.go(url)
 
-    body = grab.response.unicode_body()
+    if grab.response.code == 304:
+        raise NotModified("not modified")
+
+    body_hash = hashlib.sha1(grab.response.body).hexdigest()
+
+    if body_hash == validators.get("body_hash"):
+        raise NotModified("not modified, same body")
+
+    response_headers = grab.response.headers
+
+    new_validators = {"body_hash": body_hash}
+
+    if response_headers.get("ETag"):
+        new_validators["etag"] = response_headers["ETag"]
+
+    if response_headers.get("Last-Modified"):
+        new_validators["last_modified"] = response_headers["Last-Modified"]
+
+    return grab.response.unicode_body(), new_validators
+
+
+def parse_body(body):
     feed = feedparser.parse(body)
 
     head = feed.get("feed")
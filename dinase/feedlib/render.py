@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from dinase.sugar.dict import iteritems
+
+from .atom import get_entry_xml
+
+
+def set_author(entry, head):
+    if "title" in head:
+        entry["author"] = {
+            "name": head["title"]["value"],
+        }
+
+    elif "author" in entry:
+        del entry["author"]
+
+
+def render_entry(entry):
+    return get_entry_xml({key: value for key, value in iteritems(entry)
+                          if not key.startswith("_")})
+
+
+def render_fragments(entry, head, no_authors=False):
+    fragments = {"default": render_entry(entry)}
+
+    if no_authors:
+        entry = dict(entry)
+        set_author(entry, head)
+        fragments["no_authors"] = render_entry(entry)
+
+    return fragments
@@ -2,7 +2,11 @@
 
 from __future__ import unicode_literals
 
+import math
+import time
+
 from dinase.logiclib import filters
+from dinase.sugar.future import string_types, integer_types
 
 from .. import datelib
 from ..config import feeds
@@ -20,6 +24,13 @@ def _get_age(value):
     return int(datelib.get_age(value) / datelib.HOURS_IN_DAY)
 
 
+def _get_timestamp(value):
+    if isinstance(value, string_types):
+        value = datelib.parse(value)
+
+    return datelib.to_timestamp(value)
+
+
 class EntryFilter(filters.Filter):
 
     _rules = (
@@ -53,3 +64,53 @@ class EntryFilter(filters.Filter):
         "title": {"value": ""},
         "summary": {"value": ""},
     }
+
+    # NOTE: virtual keys whose value changes with time, mapped to the field
+    # the age is counted from
+    _time_bases = {
+        "age": "updated",
+        "added_ago": "_added",
+    }
+
+    def __init__(self, source):
+        super(EntryFilter, self).__init__(source)
+
+        self._thresholds = []
+        self.keys = set()
+
+        for dirty_rule in source["rules"]:
+            for rule in self._unfold_rule(dirty_rule):
+                key = self._aliases.get(rule["key"], rule["key"])
+                operand = rule.get("operand")
+
+                self.keys.add(key.split(".")[0])
+
+                if key not in self._time_bases:
+                    continue
+
+                if not isinstance(operand, integer_types + (float, )):
+                    continue
+
+                # NOTE: ages are whole days, a comparison with the operand
+                # can only flip when the age reaches either neighbour of it
+                for days in set((math.ceil(operand), math.floor(operand) + 1)):
+                    self._thresholds.append((self._time_bases[key], days))
+
+        self.timed = bool(self.keys & set(self._time_bases))
+
+    def expires(self, item, now=None):
+        """Return the timestamp when the filter result may change or None."""
+
+        now = now or time.time()
+        result = None
+
+        for field, days in self._thresholds:
+            try:
+                moment = _get_timestamp(item[field]) + days * datelib.SECONDS_IN_DAY
+            except (KeyError, ValueError):
+                continue
+
+            if moment > now and (result is None or moment < result):
+                result = moment
+
+        return result
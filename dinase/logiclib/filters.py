@@ -532,6 +532,7 @@ class Filter(object):
         super(Filter, self).__init__()
 
         self.trafaret().check(source)
+        self.source = source
         self._rules_instances = []
 
         for dirty_rule in source["rules"]:
@@ -5,6 +5,8 @@ from __future__ import unicode_literals
 
 class PredicateCompiler(object):
 
+    _keywords = ("TRUE", "FALSE", "NOT", "AND", "OR", "LP", "RP")
+
     def __init__(self, functions=None):
         super(PredicateCompiler, self).__init__()
 
@@ -20,6 +22,11 @@ class PredicateCompiler(object):
         self._lex(expression)
         return self._expr()
 
+    def names(self, expression):
+        self._lex(expression)
+        return [token for token in reversed(self._tokens)
+                if token.upper() not in self._keywords]
+
     def _lex(self, expression):
         self._tokens = []
 
@@ -61,7 +68,7 @@ class PredicateCompiler(object):
         token = self._tokens.pop()
         token_upper = token.upper()
 
-        if token_upper in ("TRUE", "FALSE", "NOT", "AND", "OR", "LP", "RP"):
+        if token_upper in self._keywords:
             self._cur_token = token_upper
 
         else:
@@ -1,6 +1,21 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-from .database import drop
+from .backends import backend
 from .heads import Heads
 from .entries import Entries
+from .backlog import Backlog
+from .redirects import Redirects
+from .rubrics import RubricStates
+
+
+def init():
+    backend.init()
+
+
+def drop():
+    backend.drop()
+
+
+def is_valid_id(value):
+    return backend.is_valid_id(value)
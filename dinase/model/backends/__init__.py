@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from ...config import DATABASE
+
+
+__all__ = ("backend", )
+
+
+def _load(engine):
+    # NOTE: import engines lazily, the unused one may not be installed
+    if engine == "mongodb":
+        from .mongodb import MongoBackend
+        return MongoBackend()
+
+    if engine == "sqlite":
+        from .sqlite import SQLiteBackend
+        return SQLiteBackend(DATABASE["PATH"])
+
+    raise ValueError("unknown database engine: {}".format(engine))
+
+
+backend = _load(DATABASE.get("ENGINE", "mongodb"))
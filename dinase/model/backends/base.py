@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""Storage interface, documents are dicts shaped like MongoDB documents."""
+
+from __future__ import unicode_literals
+
+
+class Backend(object):
+
+    heads = None
+    entries = None
+    backlog = None
+    redirects = None
+    rubrics = None
+
+    def init(self):
+        raise NotImplementedError()
+
+    def drop(self):
+        raise NotImplementedError()
+
+    def new_id(self):
+        """New entry id, ids of later calls sort after earlier ones."""
+        raise NotImplementedError()
+
+    def is_valid_id(self, value):
+        raise NotImplementedError()
+
+
+class HeadStore(object):
+
+    def save(self, feed, head):
+        raise NotImplementedError()
+
+    def get(self, feed, fields=None):
+        raise NotImplementedError()
+
+
+class EntryStore(object):
+
+    def find_similar(self, feed, ids, links):
+        """Entries of the feed with one of ids or links, with _id, _added,
+        _hash, id, link and _rubrics.include only."""
+        raise NotImplementedError()
+
+    def save(self, inserts, replaces):
+        raise NotImplementedError()
+
+    def save_bodies(self, bodies):
+        """Store {"_id": entry id, "raw": {...}, "fixed": {...}} bodies."""
+        raise NotImplementedError()
+
+    def get_bodies(self, entry_ids, raw=False):
+        """Bodies by entry id, without "raw" unless asked for."""
+        raise NotImplementedError()
+
+    def update(self, updates):
+        """Set top-level fields, updates are (entry id, {key: value})."""
+        raise NotImplementedError()
+
+    def add_decisions(self, decisions):
+        """Add rubric decisions, (entry id, token, included, expires)."""
+        raise NotImplementedError()
+
+    def remove(self, entry_ids):
+        """Remove entries with their bodies."""
+        raise NotImplementedError()
+
+    def pull_stale(self, tokens):
+        """Drop decisions of tokens not listed."""
+        raise NotImplementedError()
+
+    def find_included(self, token, fields=None, limit=None, since=None, before=None):
+        """Entries included in a rubric, newest first."""
+        raise NotImplementedError()
+
+    def find_valid(self, token, fields=None, skip_included=False, sort=False,
+                   since=None, before=None):
+        """Valid entries with _fixed not excluded from a rubric."""
+        raise NotImplementedError()
+
+    def find_newest(self, fields=None):
+        """Valid entries with _fixed, newest first."""
+        raise NotImplementedError()
+
+    def find_expired(self, now, fields=None):
+        raise NotImplementedError()
+
+    def find_older(self, deadline, fields=None):
+        raise NotImplementedError()
+
+    def find_surplus(self, feed, keep, fields=None):
+        """Entries of the feed beyond the newest keep ones."""
+        raise NotImplementedError()
+
+    def find_raw(self):
+        """All entries without _fixed, _valid and _rubrics, the raw fields
+        of entries saved with a body are in the body store."""
+        raise NotImplementedError()
+
+    def get_added(self, feed, count):
+        raise NotImplementedError()
+
+    def get_feeds(self):
+        raise NotImplementedError()
+
+
+class BacklogStore(object):
+
+    def add(self, feeds, now):
+        raise NotImplementedError()
+
+    def discard(self, feeds):
+        raise NotImplementedError()
+
+    def get(self):
+        """Feed names, oldest first."""
+        raise NotImplementedError()
+
+
+class RedirectStore(object):
+
+    def get_many(self, urls, now):
+        raise NotImplementedError()
+
+    def save(self, locations, expires):
+        raise NotImplementedError()
+
+
+class RubricStateStore(object):
+
+    def get_complete(self):
+        raise NotImplementedError()
+
+    def is_complete(self, token):
+        raise NotImplementedError()
+
+    def set_complete(self, token):
+        raise NotImplementedError()
+
+    def discard_stale(self, tokens):
+        raise NotImplementedError()
+
+    def reset(self):
+        raise NotImplementedError()
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import pymongo
+from bson import ObjectId
+
+from dinase.sugar.dict import iteritems
+
+from . import base
+from .. import database as _database
+from ..database import get_database
+
+
+class MongoBackend(base.Backend):
+
+    def __init__(self):
+        super(MongoBackend, self).__init__()
+
+        self.heads = MongoHeadStore()
+        self.entries = MongoEntryStore()
+        self.backlog = MongoBacklogStore()
+        self.redirects = MongoRedirectStore()
+        self.rubrics = MongoRubricStateStore()
+
+    def init(self):
+        _database.init()
+
+    def drop(self):
+        _database.drop()
+
+    def new_id(self):
+        return ObjectId()
+
+    def is_valid_id(self, value):
+        return ObjectId.is_valid(value)
+
+
+class _Store(object):
+
+    _name = None
+
+    @property
+    def _collection(self):
+        return get_database()[self._name]
+
+
+class MongoHeadStore(_Store, base.HeadStore):
+
+    _name = "heads"
+
+    def save(self, feed, head):
+        self._collection.find_and_modify({"_feed": feed}, head, new=True, upsert=True)
+
+    def get(self, feed, fields=None):
+        return self._collection.find_one({"_feed": feed}, fields=fields)
+
+
+class MongoEntryStore(_Store, base.EntryStore):
+
+    _name = "entries"
+
+    @property
+    def _bodies(self):
+        return get_database()["bodies"]
+
+    def find_similar(self, feed, ids, links):
+        return self._collection.find(
+            {"_feed": feed,
+             "$or": [{"id": {"$in": ids}}, {"link": {"$in": links}}]},
+            fields=["_id", "_added", "_hash", "id", "link", "_rubrics.include"])
+
+    def save(self, inserts, replaces):
+        bulk = _Bulk(self._collection)
+
+        for entry in inserts:
+            bulk.insert(entry)
+
+        for entry in replaces:
+            bulk.replace({"_id": entry["_id"]}, entry)
+
+        bulk.flush()
+
+    def save_bodies(self, bodies):
+        bulk = _Bulk(self._bodies)
+
+        for body in bodies:
+            bulk.replace({"_id": body["_id"]}, body, upsert=True)
+
+        bulk.flush()
+
+    def get_bodies(self, entry_ids, raw=False):
+        bodies = self._bodies.find({"_id": {"$in": list(entry_ids)}},
+                                   fields=None if raw else ["fixed"])
+
+        return {body["_id"]: body for body in bodies}
+
+    def update(self, updates):
+        bulk = _Bulk(self._collection)
+
+        for entry_id, fields in updates:
+            bulk.update({"_id": entry_id}, {"$set": fields})
+
+        bulk.flush()
+
+    def add_decisions(self, decisions):
+        bulk = _Bulk(self._collection)
+
+        for entry_id, token, included, expires in decisions:
+            section = "include" if included else "exclude"
+            document = {"$addToSet": {"_rubrics.{}".format(section): token}}
+
+            if expires is not None:
+                document["$min"] = {"_rubrics.expires": expires}
+
+            bulk.update({"_id": entry_id}, document)
+
+        bulk.flush()
+
+    def remove(self, entry_ids):
+        spec = {"_id": {"$in": list(entry_ids)}}
+        self._collection.remove(spec, safe=True)
+        self._bodies.remove(spec, safe=True)
+
+    def pull_stale(self, tokens):
+        stale = {"$nin": list(tokens)}
+
+        self._collection.update(
+            {"$or": [{"_rubrics.include": {"$elemMatch": stale}},
+                     {"_rubrics.exclude": {"$elemMatch": stale}}]},
+            {"$pull": {"_rubrics.include": stale,
+                       "_rubrics.exclude": stale}},
+            upsert=False, multi=True, safe=True
+        )
+
+    def find_included(self, token, fields=None, limit=None, since=None, before=None):
+        query = _get_range({"_rubrics.include": token}, since, before)
+        entries = self._collection.find(query, fields=fields).sort(_NEWEST_FIRST)
+
+        if limit:
+            entries = entries.limit(limit)
+
+        return entries
+
+    def find_valid(self, token, fields=None, skip_included=False, sort=False,
+                   since=None, before=None):
+        query = {"_valid": True, "_fixed": {"$ne": None},
+                 "_rubrics.exclude": {"$ne": token}}
+
+        if skip_included:
+            query["_rubrics.include"] = {"$ne": token}
+
+        entries = self._collection.find(_get_range(query, since, before), fields=fields)
+
+        if sort:
+            entries = entries.sort(_NEWEST_FIRST)
+
+        return entries
+
+    def find_newest(self, fields=None):
+        return self._collection.find({"_valid": True, "_fixed": {"$ne": None}},
+                                     fields=fields).sort(_NEWEST_FIRST)
+
+    def find_expired(self, now, fields=None):
+        return self._collection.find({"_rubrics.expires": {"$lte": now}}, fields=fields)
+
+    def find_older(self, deadline, fields=None):
+        return self._collection.find({"_added": {"$lt": deadline}}, fields=fields)
+
+    def find_surplus(self, feed, keep, fields=None):
+        return self._collection.find({"_feed": feed}, fields=fields).sort(
+            "_added", direction=pymongo.DESCENDING).skip(keep)
+
+    def find_raw(self):
+        return self._collection.find(
+            fields={"_fixed": False, "_valid": False, "_rubrics": False})
+
+    def get_added(self, feed, count):
+        entries = self._collection.find({"_feed": feed}, fields=["_added"]).sort(
+            "_added", direction=pymongo.DESCENDING).limit(count)
+
+        return [entry["_added"] for entry in entries]
+
+    def get_feeds(self):
+        return self._collection.distinct("_feed")
+
+
+class MongoBacklogStore(_Store, base.BacklogStore):
+
+    _name = "backlog"
+
+    def add(self, feeds, now):
+        for feed in feeds:
+            self._collection.update({"_feed": feed},
+                                    {"$setOnInsert": {"_added": now}},
+                                    upsert=True, safe=True)
+
+    def discard(self, feeds):
+        self._collection.remove({"_feed": {"$in": list(feeds)}}, safe=True)
+
+    def get(self):
+        entries = self._collection.find(fields=["_feed"]).sort(
+            "_added", direction=pymongo.ASCENDING)
+
+        return [entry["_feed"] for entry in entries]
+
+
+class MongoRedirectStore(_Store, base.RedirectStore):
+
+    _name = "redirects"
+
+    def get_many(self, urls, now):
+        redirects = self._collection.find(
+            {"_url": {"$in": list(urls)}, "_expires": {"$gt": now}},
+            fields=["_url", "location"])
+
+        return {redirect["_url"]: redirect["location"] for redirect in redirects}
+
+    def save(self, locations, expires):
+        for url, location in iteritems(locations):
+            self._collection.update({"_url": url},
+                                    {"_url": url,
+                                     "location": location,
+                                     "_expires": expires},
+                                    upsert=True, safe=True)
+
+
+class MongoRubricStateStore(_Store, base.RubricStateStore):
+
+    _name = "rubrics"
+
+    def get_complete(self):
+        states = self._collection.find({"complete": True}, fields=["_rubric"])
+        return set(state["_rubric"] for state in states)
+
+    def is_complete(self, token):
+        return self._collection.find_one({"_rubric": token, "complete": True},
+                                         fields=["_id"]) is not None
+
+    def set_complete(self, token):
+        self._collection.update({"_rubric": token},
+                                {"$set": {"complete": True}},
+                                upsert=True, safe=True)
+
+    def discard_stale(self, tokens):
+        self._collection.remove({"_rubric": {"$nin": list(tokens)}}, safe=True)
+
+    def reset(self):
+        self._collection.update({}, {"$set": {"complete": False}},
+                                upsert=False, multi=True, safe=True)
+
+
+_NEWEST_FIRST = [("_added", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]
+
+
+def _get_range(query, since=None, before=None):
+    conditions = [query]
+
+    if since is not None:
+        conditions.append({"_added": {"$gt": since}})
+
+    if before is not None:
+        added, entry_id = before
+        conditions.append({"$or": [{"_added": {"$lt": added}},
+                                   {"_added": added, "_id": {"$lt": ObjectId(entry_id)}}]})
+
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class _Bulk(object):
+
+    _size = 1000
+
+    def __init__(self, collection):
+        super(_Bulk, self).__init__()
+
+        self._collection = collection
+        self._bulk = None
+        self._count = 0
+
+    def insert(self, document):
+        self._get().insert(document)
+        self._added()
+
+    def replace(self, spec, document, upsert=False):
+        view = self._get().find(spec)
+
+        if upsert:
+            view = view.upsert()
+
+        view.replace_one(document)
+        self._added()
+
+    def update(self, spec, document):
+        self._get().find(spec).update_one(document)
+        self._added()
+
+    def flush(self):
+        if self._bulk is None:
+            return
+
+        bulk = self._bulk
+        self._bulk = None
+        self._count = 0
+        bulk.execute(write_concern={"w": 1})
+
+    def _get(self):
+        if self._bulk is None:
+            self._bulk = self._collection.initialize_unordered_bulk_op()
+
+        return self._bulk
+
+    def _added(self):
+        self._count += 1
+
+        if self._count >= self._size:
+            self.flush()
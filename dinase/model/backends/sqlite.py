@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import json
+import binascii
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from dinase.sugar.coll import chunks
+from dinase.sugar.dict import iteritems
+
+from . import base
+
+
+# NOTE: older sqlite builds allow at most 999 parameters per statement
+_PARAMS_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS heads (
+    feed TEXT PRIMARY KEY,
+    document TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS entries (
+    _id TEXT PRIMARY KEY,
+    feed TEXT NOT NULL,
+    entry_id TEXT,
+    link TEXT,
+    added timestamp NOT NULL,
+    hash TEXT,
+    valid INTEGER NOT NULL DEFAULT 0,
+    expires timestamp,
+    fixed TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_feed_id ON entries (feed, entry_id);
+CREATE INDEX IF NOT EXISTS entries_feed_link ON entries (feed, link);
+CREATE INDEX IF NOT EXISTS entries_feed_added ON entries (feed, added DESC);
+CREATE INDEX IF NOT EXISTS entries_valid_added ON entries (valid, added DESC, _id DESC);
+CREATE INDEX IF NOT EXISTS entries_added ON entries (added DESC, _id DESC);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)
+    WHERE expires IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS bodies (
+    entry TEXT PRIMARY KEY,
+    raw TEXT NOT NULL,
+    fixed TEXT
+);
+
+CREATE TABLE IF NOT EXISTS decisions (
+    entry TEXT NOT NULL,
+    token TEXT NOT NULL,
+    include INTEGER NOT NULL,
+    added timestamp NOT NULL,
+    PRIMARY KEY (entry, token)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS decisions_token
+    ON decisions (token, include, added DESC, entry DESC);
+
+CREATE TABLE IF NOT EXISTS backlog (
+    feed TEXT PRIMARY KEY,
+    added timestamp NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS redirects (
+    url TEXT PRIMARY KEY,
+    location TEXT NOT NULL,
+    expires timestamp NOT NULL
+);
+CREATE INDEX IF NOT EXISTS redirects_expires ON redirects (expires);
+
+CREATE TABLE IF NOT EXISTS rubrics (
+    token TEXT PRIMARY KEY,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# NOTE: added is copied from the entry, so included entries are read in
+# order from the decisions_token index
+_INSERT_DECISION = (
+    "INSERT OR REPLACE INTO decisions (entry, token, include, added) "
+    "SELECT ?, ?, ?, added FROM entries WHERE _id = ?"
+)
+
+_ID_RE = re.compile(r"^[0-9a-f]{24}$")
+
+_TABLES = ("heads", "entries", "bodies", "decisions", "backlog", "redirects", "rubrics")
+
+
+class _Database(object):
+
+    def __init__(self, path):
+        super(_Database, self).__init__()
+
+        self._path = path
+        self._local = threading.local()
+
+    def reader(self):
+        """Autocommit connection, iterating it survives commits of writer."""
+        return self._get("reader", None)
+
+    @contextmanager
+    def writer(self):
+        connection = self._get("writer", "")
+
+        with connection:
+            yield connection
+
+    def _get(self, name, isolation_level):
+        # NOTE: connections are per thread and are not reused after a fork
+        pid = os.getpid()
+        connection, connection_pid = getattr(self._local, name, (None, None))
+
+        if connection is None or connection_pid != pid:
+            connection = sqlite3.connect(self._path, timeout=60,
+                                         isolation_level=isolation_level,
+                                         detect_types=sqlite3.PARSE_DECLTYPES)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+
+            # NOTE: a read on every connection, the schema is written once
+            exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries'"
+            ).fetchone()
+
+            if exists is None:
+                connection.executescript(_SCHEMA)
+
+            setattr(self._local, name, (connection, pid))
+
+        return connection
+
+
+class SQLiteBackend(base.Backend):
+
+    def __init__(self, path):
+        super(SQLiteBackend, self).__init__()
+
+        self._database = _Database(path)
+        self.heads = SQLiteHeadStore(self._database)
+        self.entries = SQLiteEntryStore(self._database)
+        self.backlog = SQLiteBacklogStore(self._database)
+        self.redirects = SQLiteRedirectStore(self._database)
+        self.rubrics = SQLiteRubricStateStore(self._database)
+
+    def init(self):
+        with self._database.writer() as connection:
+            connection.executescript(_SCHEMA)
+            connection.execute("ANALYZE")
+
+    def drop(self):
+        with self._database.writer() as connection:
+            for table in _TABLES:
+                connection.execute("DROP TABLE IF EXISTS {}".format(table))
+
+            connection.executescript(_SCHEMA)
+
+    def new_id(self):
+        # NOTE: shaped as an ObjectId, seconds first then random bytes
+        return "{:08x}{}".format(int(time.time()),
+                                 binascii.hexlify(os.urandom(8)).decode("ascii"))
+
+    def is_valid_id(self, value):
+        return _ID_RE.match(value) is not None
+
+
+class _Store(object):
+
+    def __init__(self, database):
+        super(_Store, self).__init__()
+
+        self._database = database
+
+
+class SQLiteHeadStore(_Store, base.HeadStore):
+
+    def save(self, feed, head):
+        with self._database.writer() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO heads (feed, document) VALUES (?, ?)",
+                (feed, _dumps(head)))
+
+    def get(self, feed, fields=None):
+        row = self._database.reader().execute(
+            "SELECT document FROM heads WHERE feed = ?", (feed, )).fetchone()
+
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+
+# NOTE: document keys mapped to the columns holding them
+_ENTRY_COLUMNS = (
+    ("_feed", "e.feed"),
+    ("_added", "e.added"),
+    ("_hash", "e.hash"),
+    ("_valid", "e.valid"),
+    ("_fixed", "e.fixed"),
+    ("id", "e.entry_id"),
+    ("link", "e.link"),
+    ("_rubrics", "e.expires, "
+                 "(SELECT group_concat(token, char(31)) FROM decisions "
+                 "WHERE entry = e._id AND include = 1), "
+                 "(SELECT group_concat(token, char(31)) FROM decisions "
+                 "WHERE entry = e._id AND include = 0)"),
+)
+
+_RAW_KEYS = ("_feed", "_added", "_hash", "id", "link")
+
+
+class SQLiteEntryStore(_Store, base.EntryStore):
+
+    def find_similar(self, feed, ids, links):
+        result = []
+
+        for column, values in (("entry_id", ids), ("link", links)):
+            for batch in chunks(values, _PARAMS_SIZE):
+                result.extend(self._find(
+                    ["_added", "_hash", "id", "link", "_rubrics"],
+                    "e.feed = ? AND e.{} IN ({})".format(column, _marks(batch)),
+                    [feed] + batch))
+
+        return list({entry["_id"]: entry for entry in result}.values())
+
+    def save(self, inserts, replaces):
+        entries = list(inserts) + list(replaces)
+
+        with self._database.writer() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO entries (_id, feed, entry_id, link, added, "
+                "hash, valid, expires, fixed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [_encode_entry(entry) for entry in entries])
+            self._set_decisions(connection, [
+                (entry["_id"], entry["_rubrics"]) for entry in entries])
+
+    def save_bodies(self, bodies):
+        with self._database.writer() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO bodies (entry, raw, fixed) VALUES (?, ?, ?)",
+                [(str(body["_id"]), _dumps(body["raw"]),
+                  _dumps(body["fixed"]) if body["fixed"] else None)
+                 for body in bodies])
+
+    def get_bodies(self, entry_ids, raw=False):
+        result = {}
+        reader = self._database.reader()
+
+        for batch in chunks([str(entry_id) for entry_id in entry_ids], _PARAMS_SIZE):
+            rows = reader.execute(
+                "SELECT entry, fixed{} FROM bodies WHERE entry IN ({})".format(
+                    ", raw" if raw else "", _marks(batch)),
+                batch)
+
+            for row in rows:
+                body = {"_id": row[0], "fixed": json.loads(row[1]) if row[1] else None}
+
+                if raw:
+                    body["raw"] = json.loads(row[2])
+
+                result[row[0]] = body
+
+        return result
+
+    def update(self, updates):
+        with self._database.writer() as connection:
+            for entry_id, fields in updates:
+                entry_id = str(entry_id)
+
+                if "_fixed" in fields:
+                    connection.execute("UPDATE entries SET fixed = ? WHERE _id = ?",
+                                       (_dumps_fixed(fields["_fixed"]), entry_id))
+
+                if "_valid" in fields:
+                    connection.execute("UPDATE entries SET valid = ? WHERE _id = ?",
+                                       (bool(fields["_valid"]), entry_id))
+
+                if "_rubrics" in fields:
+                    connection.execute("UPDATE entries SET expires = ? WHERE _id = ?",
+                                       (fields["_rubrics"].get("expires"), entry_id))
+                    self._set_decisions(connection, [(entry_id, fields["_rubrics"])])
+
+    def add_decisions(self, decisions):
+        decisions = [(str(entry_id), token, included, expires)
+                     for entry_id, token, included, expires in decisions]
+
+        with self._database.writer() as connection:
+            connection.executemany(
+                _INSERT_DECISION,
+                [(entry_id, token, bool(included), entry_id)
+                 for entry_id, token, included, _ in decisions])
+            connection.executemany(
+                "UPDATE entries SET expires = min(coalesce(expires, ?), ?) WHERE _id = ?",
+                [(expires, expires, entry_id)
+                 for entry_id, _, _, expires in decisions if expires is not None])
+
+    def remove(self, entry_ids):
+        entry_ids = [(str(entry_id), ) for entry_id in entry_ids]
+
+        with self._database.writer() as connection:
+            connection.executemany("DELETE FROM decisions WHERE entry = ?", entry_ids)
+            connection.executemany("DELETE FROM bodies WHERE entry = ?", entry_ids)
+            connection.executemany("DELETE FROM entries WHERE _id = ?", entry_ids)
+
+    def pull_stale(self, tokens):
+        tokens = list(tokens)
+
+        with self._database.writer() as connection:
+            connection.execute(
+                "DELETE FROM decisions WHERE token NOT IN ({})".format(_marks(tokens)),
+                tokens)
+
+    def find_included(self, token, fields=None, limit=None, since=None, before=None):
+        # NOTE: a range scan of decisions_token joined back to entries
+        where, params = _get_range("d.token = ? AND d.include = 1", [token],
+                                   since, before, added="d.added", entry_id="d.entry")
+
+        return self._find(fields, where, params,
+                          order="d.added DESC, d.entry DESC", limit=limit,
+                          source="decisions AS d JOIN entries AS e ON e._id = d.entry")
+
+    def find_valid(self, token, fields=None, skip_included=False, sort=False,
+                   since=None, before=None):
+        decided = "" if skip_included else " AND include = 0"
+        where, params = _get_range(
+            "e.valid = 1 AND e.fixed IS NOT NULL AND NOT EXISTS ("
+            "SELECT 1 FROM decisions WHERE entry = e._id AND token = ?{})".format(decided),
+            [token], since, before)
+
+        return self._find(fields, where, params,
+                          order="e.valid, e.added DESC, e._id DESC" if sort else None)
+
+    def find_newest(self, fields=None):
+        return self._find(fields, "e.valid = 1 AND e.fixed IS NOT NULL",
+                          order="e.valid, e.added DESC, e._id DESC")
+
+    def find_expired(self, now, fields=None):
+        return self._find(fields, "e.expires <= ?", [now])
+
+    def find_older(self, deadline, fields=None):
+        return self._find(fields, "e.added < ?", [deadline])
+
+    def find_surplus(self, feed, keep, fields=None):
+        return self._find(fields, "e.feed = ?", [feed],
+                          order="e.feed, e.added DESC", limit=-1, offset=keep)
+
+    def find_raw(self):
+        return self._find(_RAW_KEYS)
+
+    def get_added(self, feed, count):
+        return [entry["_added"] for entry in self._find(
+            ["_added"], "e.feed = ?", [feed], order="e.feed, e.added DESC", limit=count)]
+
+    def get_feeds(self):
+        rows = self._database.reader().execute("SELECT DISTINCT feed FROM entries")
+        return [row[0] for row in rows]
+
+    def _find(self, fields, where=None, params=(), order=None, limit=None, offset=None,
+              source="entries AS e"):
+        keys = None
+
+        if fields is not None:
+            keys = set(field.split(".")[0] for field in fields)
+
+            if "_fixed" in keys:
+                keys.add("_added")
+        columns = [(key, sql) for key, sql in _ENTRY_COLUMNS
+                   if keys is None or key in keys]
+
+        sql = ["SELECT e._id"]
+        sql.extend(", {}".format(column) for _, column in columns)
+        sql.append(" FROM {}".format(source))
+
+        if where:
+            sql.append(" WHERE {}".format(where))
+
+        if order:
+            sql.append(" ORDER BY {}".format(order))
+
+        if limit is not None:
+            sql.append(" LIMIT {:d}".format(limit))
+
+        if offset is not None:
+            sql.append(" OFFSET {:d}".format(offset))
+
+        rows = self._database.reader().execute("".join(sql), list(params))
+
+        for row in rows:
+            yield _decode_entry([key for key, _ in columns], row)
+
+    @staticmethod
+    def _set_decisions(connection, rubrics):
+        connection.executemany("DELETE FROM decisions WHERE entry = ?",
+                               [(str(entry_id), ) for entry_id, _ in rubrics])
+        connection.executemany(
+            _INSERT_DECISION,
+            [(str(entry_id), token, section == "include", str(entry_id))
+             for entry_id, decisions in rubrics
+             for section in ("include", "exclude")
+             for token in decisions.get(section, ())])
+
+
+class SQLiteBacklogStore(_Store, base.BacklogStore):
+
+    def add(self, feeds, now):
+        with self._database.writer() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO backlog (feed, added) VALUES (?, ?)",
+                [(feed, now) for feed in feeds])
+
+    def discard(self, feeds):
+        with self._database.writer() as connection:
+            connection.executemany("DELETE FROM backlog WHERE feed = ?",
+                                   [(feed, ) for feed in feeds])
+
+    def get(self):
+        rows = self._database.reader().execute(
+            "SELECT feed FROM backlog ORDER BY added")
+        return [row[0] for row in rows]
+
+
+class SQLiteRedirectStore(_Store, base.RedirectStore):
+
+    def get_many(self, urls, now):
+        result = {}
+
+        for batch in chunks(urls, _PARAMS_SIZE):
+            rows = self._database.reader().execute(
+                "SELECT url, location FROM redirects "
+                "WHERE url IN ({}) AND expires > ?".format(_marks(batch)),
+                batch + [now])
+            result.update(rows)
+
+        return result
+
+    def save(self, locations, expires):
+        with self._database.writer() as connection:
+            # NOTE: there is no TTL index, expired redirects go on each save
+            connection.execute("DELETE FROM redirects WHERE expires <= ?",
+                               (datetime.datetime.today(), ))
+            connection.executemany(
+                "INSERT OR REPLACE INTO redirects (url, location, expires) "
+                "VALUES (?, ?, ?)",
+                [(url, location, expires) for url, location in iteritems(locations)])
+
+
+class SQLiteRubricStateStore(_Store, base.RubricStateStore):
+
+    def get_complete(self):
+        rows = self._database.reader().execute(
+            "SELECT token FROM rubrics WHERE complete = 1")
+        return set(row[0] for row in rows)
+
+    def is_complete(self, token):
+        return self._database.reader().execute(
+            "SELECT 1 FROM rubrics WHERE token = ? AND complete = 1",
+            (token, )).fetchone() is not None
+
+    def set_complete(self, token):
+        with self._database.writer() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO rubrics (token, complete) VALUES (?, 1)",
+                (token, ))
+
+    def discard_stale(self, tokens):
+        tokens = list(tokens)
+
+        with self._database.writer() as connection:
+            connection.execute(
+                "DELETE FROM rubrics WHERE token NOT IN ({})".format(_marks(tokens)),
+                tokens)
+
+    def reset(self):
+        with self._database.writer() as connection:
+            connection.execute("UPDATE rubrics SET complete = 0")
+
+
+def _marks(values):
+    return ", ".join("?" * len(values))
+
+
+def _get_range(where, params, since=None, before=None, added="e.added", entry_id="e._id"):
+    where, params = [where], list(params)
+
+    if since is not None:
+        where.append("{} > ?".format(added))
+        params.append(since)
+
+    if before is not None:
+        where.append("({0} < ? OR ({0} = ? AND {1} < ?))".format(added, entry_id))
+        params.extend([before[0], before[0], str(before[1])])
+
+    return " AND ".join(where), params
+
+
+def _dumps(document):
+    return json.dumps(document, sort_keys=True, default=str)
+
+
+def _dumps_fixed(fixed_entry):
+    if not fixed_entry:
+        return None
+
+    # NOTE: _added has a column of its own, restored on load
+    return _dumps({key: value for key, value in iteritems(fixed_entry)
+                   if key != "_added"})
+
+
+def _encode_entry(entry):
+    rubrics = entry.get("_rubrics") or {}
+
+    return (
+        str(entry["_id"]),
+        entry["_feed"],
+        entry.get("id"),
+        entry.get("link"),
+        entry["_added"],
+        entry.get("_hash"),
+        bool(entry.get("_valid")),
+        rubrics.get("expires"),
+        _dumps_fixed(entry.get("_fixed")),
+    )
+
+
+def _decode_entry(keys, row):
+    values = iter(row)
+    entry = {"_id": next(values)}
+
+    for key in keys:
+        if key == "_rubrics":
+            expires, include, exclude = next(values), next(values), next(values)
+            entry["_rubrics"] = {
+                "include": include.split("\x1f") if include else [],
+                "exclude": exclude.split("\x1f") if exclude else [],
+            }
+
+            if expires is not None:
+                entry["_rubrics"]["expires"] = expires
+
+        elif key == "_valid":
+            entry[key] = bool(next(values))
+
+        elif key == "_fixed":
+            value = next(values)
+            entry[key] = json.loads(value) if value else None
+
+        else:
+            value = next(values)
+
+            if value is not None:
+                entry[key] = value
+
+    # NOTE: _fixed is selected after _added, see _ENTRY_COLUMNS
+    if entry.get("_fixed") and "_added" in entry:
+        entry["_fixed"]["_added"] = entry["_added"]
+
+    return entry
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from .backends import backend
+
+
+class Backlog(object):
+
+    _store = backend.backlog
+
+    @classmethod
+    def add(cls, feeds):
+        cls._store.add(feeds, datetime.datetime.today())
+
+    @classmethod
+    def discard(cls, feeds):
+        if not feeds:
+            return
+
+        cls._store.discard(feeds)
+
+    @classmethod
+    def get(cls):
+        return cls._store.get()
@@ -3,31 +3,101 @@
 from __future__ import unicode_literals
 
 import logging
+import os
+import threading
 import traceback
 import pymongo
 
 from ..config import DATABASE
 
 
-__all__ = ("database", "drop")
+__all__ = ("get_database", "init", "drop")
 
 
-try:
-    _connection = pymongo.Connection(
-        DATABASE["HOST"],
-        DATABASE["PORT"],
-    )
-except pymongo.errors.ConnectionFailure:
-    exception = "".join(traceback.format_exc())
-    logging.critical("cannot connect to mongodb server")
-    logging.debug(exception)
-    raise
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
 
-# TODO: impl auth
 
-database = _connection[DATABASE["NAME"]]
+def get_database():
+    """Return the database of a client created on first use in a process."""
+
+    global _client, _client_pid  # pylint: disable=W0603
+
+    pid = os.getpid()
+
+    # NOTE: a client inherited through fork shares sockets with the
+    # parent, the child creates its own
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = _connect()
+                _client_pid = pid
+
+    return _client[DATABASE["NAME"]]
+
+
+def _connect():
+    # TODO: impl auth
+
+    try:
+        return pymongo.MongoClient(
+            DATABASE["HOST"],
+            DATABASE["PORT"],
+            max_pool_size=DATABASE["POOL_SIZE"],
+            connectTimeoutMS=int(DATABASE["CONNECT_TIMEOUT"] * 1000),
+            socketTimeoutMS=int(DATABASE["SOCKET_TIMEOUT"] * 1000),
+            waitQueueTimeoutMS=int(DATABASE["SOCKET_TIMEOUT"] * 1000),
+        )
+    except pymongo.errors.ConnectionFailure:
+        exception = "".join(traceback.format_exc())
+        logging.critical("cannot connect to mongodb server")
+        logging.debug(exception)
+        raise
+
+
+# NOTE: no TTL index on _added, Entries.trim() owns expiry
+_indexes = {
+    "heads": (
+        ([("_feed", pymongo.ASCENDING)], {"unique": True}),
+    ),
+    "entries": (
+        ([("_feed", pymongo.ASCENDING), ("id", pymongo.ASCENDING)], {}),
+        ([("_feed", pymongo.ASCENDING), ("link", pymongo.ASCENDING)], {}),
+        ([("_feed", pymongo.ASCENDING), ("_added", pymongo.DESCENDING)], {}),
+        ([("_valid", pymongo.ASCENDING), ("_added", pymongo.DESCENDING),
+          ("_id", pymongo.DESCENDING)], {}),
+        ([("_rubrics.include", pymongo.ASCENDING), ("_added", pymongo.DESCENDING),
+          ("_id", pymongo.DESCENDING)], {}),
+        ([("_rubrics.expires", pymongo.ASCENDING)], {"sparse": True}),
+        ([("_added", pymongo.DESCENDING)], {}),
+    ),
+    "backlog": (
+        ([("_feed", pymongo.ASCENDING)], {"unique": True}),
+    ),
+    "rubrics": (
+        ([("_rubric", pymongo.ASCENDING)], {"unique": True}),
+    ),
+    "redirects": (
+        ([("_url", pymongo.ASCENDING)], {"unique": True}),
+        ([("_expires", pymongo.ASCENDING)], {"expireAfterSeconds": 0}),
+    ),
+}
+
+
+def init():
+    database = get_database()
+
+    for collection, indexes in sorted(_indexes.items()):
+        for keys, options in indexes:
+            database[collection].create_index(keys, **options)
 
 
 def drop():
+    database = get_database()
     database.drop_collection("heads")
     database.drop_collection("entries")
+    database.drop_collection("bodies")
+    database.drop_collection("backlog")
+    database.drop_collection("redirects")
+    database.drop_collection("rubrics")
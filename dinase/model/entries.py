@@ -3,121 +3,612 @@
 from __future__ import unicode_literals
 
 import datetime
-from copy import copy
+import hashlib
+import json
+import logging
+import multiprocessing
+import threading
+from collections import defaultdict
+
+from dinase.sugar.coll import chunks
+from dinase.sugar.dict import iteritems, itervalues
+from dinase.sugar.func import unzip
+
+from .backends import backend
+from .heads import Heads
+from .redirects import Redirects
+from .rubrics import RubricStates
+from .. import versions
+from ..config import PROCESS_COUNT, RETENTION, rubrics
+from ..feedlib import fix_entry, content, render_fragments
 
-import pymongo
 
-from .database import database
-from .heads import Heads
-from ..config import rubrics
-from ..feedlib import fix_entry, content
+_BULK_SIZE = 1000
+_WRITE_BEHIND_SIZE = 100
+
+# NOTE: heavy _fixed fields, kept in the body store with the raw entry
+_BODY_KEYS = frozenset(("summary", "content", "_atom"))
+
+# NOTE: the author variant of fragments is rendered only if it is served
+_NO_AUTHORS = any(rubric["no_authors"] for rubric in itervalues(rubrics))
+
+_rules_lock = threading.Lock()
 
 
 class Entries(object):
 
-    _entries = database["entries"]
+    _store = backend.entries
 
     @classmethod
-    def save(cls, entries, feed):
-        def compare(a, b):
-            def f(d):
-                return {k: v for k, v in d.items() if not k.startswith("_")}
+    def save(cls, entries, feed, head=None):
+        entries = [entry for entry in reversed(entries)
+                   if "id" in entry or "link" in entry]
 
-            return b is not None and f(a) == f(b)
+        if not entries:
+            return 0
 
-        count = 0
+        similar_entries = cls._find_similar(entries, feed)
+        pending = {}
+        inserts = set()
+        tokens = set()
 
-        for entry in reversed(copy(entries)):
-            query = {}
+        for entry in entries:
+            key = _get_key(entry)
+            fingerprint = _get_fingerprint(entry)
 
-            for key in ("id", "link"):
-                if key in entry:
-                    query[key] = entry[key]
+            if key in pending:
+                similar_entry = pending[key]
 
-            if not query:
-                continue
+            else:
+                similar_entry = _match(entry, similar_entries)
 
-            query["_feed"] = feed
-            similar_entry = cls._entries.find_one(query)
+                if similar_entry and similar_entry.get("_hash") == fingerprint:
+                    continue
 
-            if compare(entry, similar_entry):
-                continue
+                if similar_entry:
+                    tokens.update(_get_included(similar_entry))
 
+            entry = dict(entry)
+            fixed_entry = entry.pop("_fixed", None)
             entry["_feed"] = feed
-            entry["_rubrics"] = {"include": [], "exclude": []}
-            entry["_valid"] = True
-            entry["_fixed"] = None
+            entry["_hash"] = fingerprint
 
             if similar_entry:
                 entry["_id"] = similar_entry["_id"]
                 entry["_added"] = similar_entry["_added"]
 
             else:
+                entry["_id"] = backend.new_id()
                 entry["_added"] = datetime.datetime.today()
-                count += 1
+                inserts.add(key)
+
+            _set_fixed(entry, fixed_entry, head)
+            tokens.update(_get_included(entry))
+            pending[key] = entry
 
-            cls._entries.save(entry, safe=True)
+        if not pending:
+            return 0
 
-        cls._entries.ensure_index("_added")
+        bodies = []
+        metas = {}
 
-        return count
+        for key, entry in iteritems(pending):
+            metas[key], body = _split(entry)
+            bodies.append(body)
+
+        cls._store.save_bodies(bodies)
+        cls._store.save(
+            [meta for key, meta in iteritems(metas) if key in inserts],
+            [meta for key, meta in iteritems(metas) if key not in inserts])
+
+        _bump(tokens)
+
+        return len(inserts)
+
+    @classmethod
+    def _find_similar(cls, entries, feed):
+        ids = [entry["id"] for entry in entries if "id" in entry]
+        links = [entry["link"] for entry in entries if "link" in entry]
+
+        similar_entries = cls._store.find_similar(feed, ids, links)
+        result = {"id": defaultdict(list), "link": defaultdict(list)}
+
+        for similar_entry in similar_entries:
+            for key in ("id", "link"):
+                if key in similar_entry:
+                    result[key][similar_entry[key]].append(similar_entry)
+
+        return result
 
     @classmethod
-    def select(cls, rubric, fields=None):
-        rule = rubrics[rubric]["rule"]
+    def select(cls, rubric, since=None, before=None, limit=None):
+        """Yield fixed entries of a rubric newest first, with their _id.
+
+        Since and before (an (_added, _id) cursor) narrow the range, limit
+        defaults to the rubric length.
+        """
+
         cache = rubrics[rubric]["cache"]
-        head = Heads.get(rubric)
-        query = {"_rubrics.exclude": {"$ne": rubric}, "_valid": True}
+        token = rubrics[rubric]["token"]
 
-        entries = cls._entries.find(query, fields=fields).sort(
-            "_added", direction=pymongo.DESCENDING)
+        if cache and RubricStates.is_complete(token):
+            entries = list(cls._store.find_included(
+                token, fields=["_fixed"], limit=limit or rubrics[rubric]["length"],
+                since=since, before=before))
+            cls._load_bodies(entries)
 
-        for entry in entries:
-            fixed_entry = entry["_fixed"]
+            for entry in entries:
+                yield _get_selected(entry)
 
-            if not fixed_entry:
-                fixed_entry = fix_entry(entry, head)
+            return
 
-                if fixed_entry:
-                    fixed_entry["_feed"] = entry["_feed"]
-                    fixed_entry["_added"] = entry["_added"]
-                    fixed_entry["id"] = "urn:dinase:{}".format(entry["_id"])
-                    content.clean(fixed_entry)
+        entries = cls._store.find_valid(
+            token, fields=["_fixed", "_rubrics.include"], sort=True,
+            since=since, before=before)
+        need_bodies = _need_bodies([rubrics[rubric]])
 
-                cls._entries.update({"_id": entry["_id"]},
-                                    {"$set": {"_valid": bool(fixed_entry),
-                                              "_fixed": fixed_entry or None}},
-                                    upsert=False, safe=True)
+        # NOTE: decisions are flushed when the caller stops iterating too
+        writer = _Buffer(cls._store.add_decisions, _WRITE_BEHIND_SIZE)
 
-            if not fixed_entry:
-                continue
+        try:
+            for chunk in chunks(entries, _WRITE_BEHIND_SIZE):
+                if need_bodies:
+                    cls._load_bodies(chunk)
+
+                selected = []
+
+                for entry in chunk:
+                    if token in entry["_rubrics"]["include"]:
+                        selected.append(entry)
+                        continue
+
+                    included, expires = _decide(rubrics[rubric], entry["_fixed"])
+
+                    if cache:
+                        writer.add((entry["_id"], token, included, expires))
+
+                    if included:
+                        selected.append(entry)
+
+                # NOTE: a rule on metadata only needs bodies of selected entries
+                if not need_bodies:
+                    cls._load_bodies(selected)
+
+                for entry in selected:
+                    yield _get_selected(entry)
+
+        finally:
+            writer.flush()
+
+    @classmethod
+    def select_many(cls, names):
+        """Select entries of many rubrics in one scan, newest first.
+
+        Every entry is routed to each rubric not yet full, decisions of
+        cached rubrics are recorded as in select. Return {rubric: [fixed]}.
+        """
+
+        targets = [rubrics[name] for name in names]
+        selected = {rubric["name"]: [] for rubric in targets}
+        need_bodies = _need_bodies(targets)
+        entries = cls._store.find_newest(fields=["_fixed", "_rubrics"])
+        writer = _Buffer(cls._store.add_decisions, _WRITE_BEHIND_SIZE)
+
+        try:
+            for chunk in chunks(entries, _WRITE_BEHIND_SIZE):
+                pending = [rubric for rubric in targets
+                           if len(selected[rubric["name"]]) < rubric["length"]]
+
+                if not pending:
+                    break
+
+                if need_bodies:
+                    cls._load_bodies(chunk)
+
+                routed = []
+
+                for entry in chunk:
+                    if _route(entry, pending, selected, writer):
+                        routed.append(entry)
+
+                if not need_bodies:
+                    cls._load_bodies(routed)
 
-            if rubric in entry["_rubrics"]["include"]:
-                yield fixed_entry
+        finally:
+            writer.flush()
+
+        return {name: [_get_selected(entry) for entry in entries]
+                for name, entries in iteritems(selected)}
+
+    @classmethod
+    def classify(cls):
+        complete = RubricStates.get_complete()
+
+        for rubric in itervalues(rubrics):
+            token = rubric["token"]
+
+            if not rubric["cache"] or token in complete:
                 continue
 
-            section = "include" if rule(fixed_entry) else "exclude"
+            entries = cls._store.find_valid(token, fields=["_fixed"], skip_included=True)
+            writer = _Buffer(cls._store.add_decisions)
+
+            for entry in cls._iter_loaded(entries, _need_bodies([rubric])):
+                included, expires = _decide(rubric, entry["_fixed"])
+                writer.add((entry["_id"], token, included, expires))
 
-            if cache:
-                cls._entries.update(
-                    {"_id": entry["_id"]},
-                    {"$push": {"_rubrics.{}".format(section): rubric}},
-                    upsert=False, safe=True,
-                )
+            writer.flush()
+            RubricStates.set_complete(token)
 
-            if section == "include":
-                yield fixed_entry
+        # NOTE: uncached rubrics keep no decisions to expire, the ones with
+        # time-based rules may change on every run
+        versions.bump([name for name, rubric in iteritems(rubrics)
+                       if not rubric["cache"] and rubric["rule"].timed])
+
+    @classmethod
+    def expire_cache(cls):
+        """Re-evaluate cached decisions that time-based rules made stale."""
+
+        entries = cls._store.find_expired(
+            datetime.datetime.today(), fields=["_fixed", "_rubrics.include"])
+        writer = _Buffer(cls._store.update)
+        need_bodies = _need_bodies(rubric for rubric in itervalues(rubrics)
+                                   if rubric["cache"])
+        tokens = set()
+
+        for entry in cls._iter_loaded(entries, need_bodies):
+            decisions = _classify(entry["_fixed"])
+            tokens.update(set(_get_included(entry)) ^ set(decisions["include"]))
+            writer.add((entry["_id"], {"_rubrics": decisions}))
+
+        writer.flush()
+
+        if tokens:
+            _bump(tokens, uncached=False)
+
+    @classmethod
+    def get_added(cls, feed, count):
+        return cls._store.get_added(feed, count)
 
     @classmethod
     def remove(cls, rubric):
-        for entry in list(cls.select(rubric, fields=["_id", ])):
-            cls._entries.remove(entry["_id"], safe=True)
+        token = rubrics[rubric]["token"]
+
+        if rubrics[rubric]["cache"]:
+            cls.expire_cache()
+
+            if RubricStates.is_complete(token):
+                entries = cls._store.find_included(token, fields=["_id"])
+                cls._remove_ids(entry["_id"] for entry in entries)
+                versions.bump_all()
+                return
+
+        # NOTE: entries are matched by a process pool over the projected
+        # fields only, ids are streamed back and removed in batches
+        entries = cls._store.find_valid(token, fields=["_fixed", "_rubrics.include"])
+        entries = cls._iter_loaded(entries, _need_bodies([rubrics[rubric]]))
+        tasks = ((rubric, chunk) for chunk in chunks(entries, _BULK_SIZE))
+        pool = multiprocessing.Pool(processes=PROCESS_COUNT)
+
+        try:
+            cls._remove_ids(entry_id for entry_ids in pool.imap(_match_rubric, tasks)
+                            for entry_id in entry_ids)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        versions.bump_all()
+
+    @classmethod
+    def _remove_ids(cls, entry_ids):
+        for batch in chunks(entry_ids, _BULK_SIZE):
+            cls._store.remove(batch)
+
+    @classmethod
+    def trim(cls):
+        """Remove entries beyond RETENTION limits, keeping protected ones."""
+
+        protected = [rubrics[name] for name in RETENTION["PROTECT_RUBRICS"]]
+
+        # NOTE: protection relies on complete cached memberships
+        cls.expire_cache()
+        cls.classify()
+
+        fields = ["_rubrics.include"]
+        evaluated = [rubric for rubric in protected if not rubric["cache"]]
+
+        if evaluated:
+            fields.append("_fixed")
+
+        candidates = []
+
+        if RETENTION["MAX_AGE"]:
+            deadline = datetime.datetime.today() - \
+                datetime.timedelta(seconds=RETENTION["MAX_AGE"])
+            candidates.append(cls._store.find_older(deadline, fields=fields))
+
+        if RETENTION["MAX_PER_FEED"]:
+            for feed in cls._store.get_feeds():
+                candidates.append(cls._store.find_surplus(
+                    feed, RETENTION["MAX_PER_FEED"], fields=fields))
+
+        for entries in candidates:
+            entries = cls._iter_loaded(entries, _need_bodies(evaluated))
+            cls._remove_ids(entry["_id"] for entry in entries
+                            if not _is_protected(entry, protected))
+
+        versions.bump_all()
 
     @classmethod
     def purge_cache(cls):
-        cls._entries.update(
-            {}, {"$set": {"_rubrics": {"include": [], "exclude": []},
-                          "_valid": True,
-                          "_fixed": None}},
-            upsert=False, multi=True, safe=True
-        )
+        tokens = [rubric["token"] for rubric in itervalues(rubrics)
+                  if rubric["cache"]]
+
+        cls._store.pull_stale(tokens)
+        RubricStates.discard_stale(tokens)
+
+    @classmethod
+    def rebuild(cls):
+        RubricStates.reset()
+
+        heads = {}
+        writer = _Buffer(cls._save_split)
+
+        for entry in cls._iter_loaded(cls._store.find_raw(), raw=True):
+            feed = entry["_feed"]
+
+            if feed not in heads:
+                heads[feed] = Heads.get(feed) or {}
+
+            fixed_entry = fix_entry(entry, heads[feed])
+
+            if fixed_entry:
+                content.clean(fixed_entry, resolve=Redirects.get)
+
+            _set_fixed(entry, fixed_entry, heads[feed])
+            writer.add(_split(entry))
+
+        writer.flush()
+
+        for rubric in itervalues(rubrics):
+            if rubric["cache"]:
+                RubricStates.set_complete(rubric["token"])
+
+        versions.bump_all()
+
+    @classmethod
+    def _load_bodies(cls, entries, raw=False):
+        if not entries:
+            return
+
+        bodies = cls._store.get_bodies([entry["_id"] for entry in entries], raw=raw)
+
+        for entry in entries:
+            body = bodies.get(entry["_id"])
+
+            # NOTE: entries stored before the split keep everything inline
+            if body is None:
+                continue
+
+            if raw:
+                entry.update(body["raw"])
+
+            if body.get("fixed") and entry.get("_fixed"):
+                entry["_fixed"].update(body["fixed"])
+
+    @classmethod
+    def _iter_loaded(cls, entries, load=True, raw=False):
+        for chunk in chunks(entries, _WRITE_BEHIND_SIZE):
+            if load:
+                cls._load_bodies(chunk, raw=raw)
+
+            for entry in chunk:
+                yield entry
+
+    @classmethod
+    def _save_split(cls, items):
+        metas, bodies = unzip(items)
+        cls._store.save_bodies(bodies)
+        cls._store.save([], metas)
+
+
+class _Buffer(object):
+
+    def __init__(self, write, size=_BULK_SIZE):
+        super(_Buffer, self).__init__()
+
+        self._write = write
+        self._size = size
+        self._items = []
+
+    def add(self, item):
+        self._items.append(item)
+
+        if len(self._items) >= self._size:
+            self.flush()
+
+    def flush(self):
+        if not self._items:
+            return
+
+        items = self._items
+        self._items = []
+        self._write(items)
+
+
+def _set_fixed(entry, fixed_entry, head=None):
+    if fixed_entry:
+        fixed_entry["_feed"] = entry["_feed"]
+        fixed_entry["_added"] = entry["_added"]
+        fixed_entry["id"] = "urn:dinase:{}".format(entry["_id"])
+
+        if head is not None:
+            try:
+                fixed_entry["_atom"] = render_fragments(fixed_entry, head, _NO_AUTHORS)
+            except Exception:  # pylint: disable=W0703
+                logging.exception("cannot render entry: {}".format(fixed_entry["id"]))
+
+    entry["_fixed"] = fixed_entry or None
+    entry["_valid"] = bool(fixed_entry)
+    entry["_rubrics"] = _classify(fixed_entry)
+
+
+def _classify(fixed_entry):
+    result = {"include": [], "exclude": []}
+
+    if not fixed_entry:
+        return result
+
+    expires = []
+
+    # NOTE: compiled rules keep state and are not thread-safe
+    with _rules_lock:
+        for name, rubric in iteritems(rubrics):
+            if not rubric["cache"]:
+                continue
+
+            try:
+                included = rubric["rule"](fixed_entry)
+                expires.append(rubric["rule"].expires(fixed_entry))
+            except Exception:  # pylint: disable=W0703
+                logging.exception("cannot classify entry: {}".format(name))
+                continue
+
+            result["include" if included else "exclude"].append(rubric["token"])
+
+    expires = [moment for moment in expires if moment is not None]
+
+    # NOTE: a single expiry per entry, all decisions are re-evaluated at once
+    if expires:
+        result["expires"] = datetime.datetime.fromtimestamp(min(expires))
+
+    return result
+
+
+def _decide(rubric, fixed_entry):
+    # NOTE: entries stored before fixing at update time may lack _fixed
+    if not fixed_entry:
+        return False, None
+
+    with _rules_lock:
+        included = rubric["rule"](fixed_entry)
+        expires = rubric["rule"].expires(fixed_entry)
+
+    if expires is not None:
+        expires = datetime.datetime.fromtimestamp(expires)
+
+    return included, expires
+
+
+def _route(entry, pending, selected, writer):
+    decisions = entry.get("_rubrics") or {}
+    routed = False
+
+    for rubric in pending:
+        token = rubric["token"]
+        entries = selected[rubric["name"]]
+
+        if len(entries) >= rubric["length"]:
+            continue
+
+        if token in decisions.get("include", ()):
+            included = True
+
+        elif token in decisions.get("exclude", ()):
+            included = False
+
+        else:
+            included, expires = _decide(rubric, entry["_fixed"])
+
+            if rubric["cache"]:
+                writer.add((entry["_id"], token, included, expires))
+
+        if included:
+            entries.append(entry)
+            routed = True
+
+    return routed
+
+
+def _is_protected(entry, protected):
+    include = entry.get("_rubrics", {}).get("include", ())
+
+    for rubric in protected:
+        if rubric["cache"]:
+            if rubric["token"] in include:
+                return True
+
+        elif entry.get("_fixed"):
+            with _rules_lock:
+                if rubric["rule"](entry["_fixed"]):
+                    return True
+
+    return False
+
+
+def _match_rubric(task):
+    rubric, entries = task
+    token = rubrics[rubric]["token"]
+    rule = rubrics[rubric]["rule"]
+
+    return [entry["_id"] for entry in entries
+            if token in entry.get("_rubrics", {}).get("include", ())
+            or rule(entry["_fixed"])]
+
+
+def _split(entry):
+    meta = {key: value for key, value in iteritems(entry)
+            if key.startswith("_") or key in ("id", "link")}
+    body = {"_id": entry["_id"],
+            "raw": {key: value for key, value in iteritems(entry)
+                    if not key.startswith("_")},
+            "fixed": None}
+
+    fixed_entry = entry.get("_fixed")
+
+    if fixed_entry:
+        meta["_fixed"] = {key: value for key, value in iteritems(fixed_entry)
+                          if key not in _BODY_KEYS}
+        body["fixed"] = {key: value for key, value in iteritems(fixed_entry)
+                         if key in _BODY_KEYS}
+
+    return meta, body
+
+
+def _get_selected(entry):
+    entry["_fixed"]["_id"] = entry["_id"]
+    return entry["_fixed"]
+
+
+def _get_included(entry):
+    return (entry.get("_rubrics") or {}).get("include", ())
+
+
+def _bump(tokens, uncached=True):
+    # NOTE: membership in rubrics evaluated on select is not known here
+    versions.bump([name for name, rubric in iteritems(rubrics)
+                   if rubric["token"] in tokens or (uncached and not rubric["cache"])])
+
+
+def _need_bodies(rubrics_):
+    return any(rubric["rule"].keys & _BODY_KEYS for rubric in rubrics_)
+
+
+def _get_key(entry):
+    return tuple(entry.get(key) for key in ("id", "link"))
+
+
+def _get_fingerprint(entry):
+    public = {k: v for k, v in iteritems(entry) if not k.startswith("_")}
+    dump = json.dumps(public, sort_keys=True, default=str)
+    return hashlib.sha1(dump.encode("utf-8")).hexdigest()
+
+
+def _match(entry, similar_entries):
+    key = "id" if "id" in entry else "link"
+
+    for similar_entry in similar_entries[key].get(entry[key], ()):
+        if all(similar_entry.get(k) == entry[k] for k in ("id", "link") if k in entry):
+            return similar_entry
+
+    return None
@@ -1,16 +1,16 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-from .database import database
+from .backends import backend
 from ..config import feeds
 
 
 class Heads(object):
 
-    _heads = database["heads"]
+    _store = backend.heads
 
     @classmethod
-    def save(cls, head, feed):
+    def save(cls, head, feed, validators=None):
         replace = feeds[feed].get("replace")
 
         if replace:
@@ -34,9 +34,21 @@ class Heads(object):
                     head["author"]["name"] = author
 
         head["_feed"] = feed
-        cls._heads.find_and_modify({"_feed": feed}, head, new=True, upsert=True)
-        cls._heads.ensure_index("_feed")
+
+        if validators:
+            head["_validators"] = validators
+
+        cls._store.save(feed, head)
 
     @classmethod
     def get(cls, feed):
-        return cls._heads.find_one({"_feed": feed})
+        return cls._store.get(feed)
+
+    @classmethod
+    def get_validators(cls, feed):
+        head = cls._store.get(feed, fields=["_validators"])
+
+        if head is None:
+            return None
+
+        return head.get("_validators")
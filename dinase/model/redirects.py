@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from .backends import backend
+from ..config import REDIRECTS
+
+
+class Redirects(object):
+
+    _store = backend.redirects
+
+    @classmethod
+    def get(cls, url):
+        return cls.get_many([url]).get(url)
+
+    @classmethod
+    def get_many(cls, urls):
+        if not urls:
+            return {}
+
+        return cls._store.get_many(urls, datetime.datetime.today())
+
+    @classmethod
+    def save(cls, locations):
+        expires = datetime.datetime.today() + \
+            datetime.timedelta(seconds=REDIRECTS["TTL"])
+
+        cls._store.save(locations, expires)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from .backends import backend
+
+
+class RubricStates(object):
+
+    _store = backend.rubrics
+
+    @classmethod
+    def get_complete(cls):
+        return cls._store.get_complete()
+
+    @classmethod
+    def is_complete(cls, rubric):
+        return cls._store.is_complete(rubric)
+
+    @classmethod
+    def set_complete(cls, rubric):
+        cls._store.set_complete(rubric)
+
+    @classmethod
+    def discard_stale(cls, rubrics):
+        cls._store.discard_stale(rubrics)
+
+    @classmethod
+    def reset(cls):
+        cls._store.reset()
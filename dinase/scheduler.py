@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import heapq
+import logging
+import time
+from collections import defaultdict
+
+from dinase.sugar.dict import iteritems
+
+from .config import SCHEDULER, feeds
+from .model import Entries
+from .updater import update
+
+
+class Scheduler(object):
+
+    def __init__(self, names=None):
+        super(Scheduler, self).__init__()
+
+        self._queue = []
+        self._failures = defaultdict(int)
+
+        now = time.time()
+
+        for name, feed in iteritems(feeds):
+            if names is not None and name not in names:
+                continue
+
+            if feed["disable"]:
+                continue
+
+            heapq.heappush(self._queue, (now, name))
+
+    def pop_due(self, now=None):
+        now = now or time.time()
+        result = []
+
+        while self._queue and self._queue[0][0] <= now:
+            result.append(heapq.heappop(self._queue)[1])
+
+        return result
+
+    def wait_time(self, now=None):
+        if not self._queue:
+            return None
+
+        return max(self._queue[0][0] - (now or time.time()), 0)
+
+    def reschedule(self, name, success, now=None):
+        now = now or time.time()
+
+        if success:
+            self._failures[name] = 0
+        else:
+            self._failures[name] += 1
+
+        interval = self.get_interval(name, now)
+        heapq.heappush(self._queue, (now + interval, name))
+
+        return interval
+
+    def get_interval(self, name, now=None):
+        feed = feeds[name]
+        min_interval = feed.get("min_interval", SCHEDULER["MIN_INTERVAL"])
+        max_interval = feed.get("max_interval", SCHEDULER["MAX_INTERVAL"])
+
+        failures = self._failures[name]
+
+        if failures:
+            interval = min_interval * 2 ** min(failures, 16)
+
+        else:
+            interval = self._get_publish_interval(name, now or time.time())
+
+            if interval is None:
+                interval = max_interval
+
+            else:
+                interval *= SCHEDULER["POLL_FACTOR"]
+
+        return max(min_interval, min(interval, max_interval))
+
+    @staticmethod
+    def _get_publish_interval(name, now):
+        added = Entries.get_added(name, SCHEDULER["SAMPLE_SIZE"])
+
+        if not added:
+            return None
+
+        # NOTE: window ends now, so a feed that went quiet slows down
+        window = datetime.datetime.fromtimestamp(now) - added[-1]
+
+        return max(window.total_seconds(), 0) / len(added)
+
+
+def run(names=None, callback=None):
+    scheduler = Scheduler(names)
+    trim_interval = SCHEDULER.get("TRIM_INTERVAL")
+    next_trim = time.time()
+
+    while True:
+        wait_time = scheduler.wait_time()
+
+        if wait_time is None:
+            logging.error("scheduler: nothing to update")
+            return
+
+        if trim_interval:
+            if next_trim <= time.time():
+                _trim()
+                next_trim = time.time() + trim_interval
+
+            wait_time = min(wait_time, max(next_trim - time.time(), 0))
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+        due = scheduler.pop_due()
+
+        if not due:
+            continue
+
+        done = []
+
+        def on_feed_updated(name, success, info):
+            done.append(name)
+            scheduler.reschedule(name, success)
+
+            if callback:
+                callback(name, success, info)
+
+        update(due, callback=on_feed_updated)
+
+        for name in due:
+            if name not in done:
+                scheduler.reschedule(name, False)
+
+
+def _trim():
+    try:
+        Entries.trim()
+    except Exception:  # pylint: disable=W0703
+        logging.exception("scheduler: cannot trim entries")
@@ -2,6 +2,7 @@
 
 from collections import Iterable, Iterator, defaultdict
 from functools import partial
+from itertools import islice
 
 from .func import identity, notnone
 from .future import *  # pylint: disable=W0622,W0401,W0614
@@ -46,3 +47,15 @@ def enum_members(start=1):
 
 def compact(collection):
     return new(collection, filter(notnone, collection))
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(islice(iterator, size))
+
+        if not chunk:
+            return
+
+        yield chunk
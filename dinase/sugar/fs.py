@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import errno
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def write_atomic(path, data, mode=0o644):
+    with open_atomic(path, mode) as fp:
+        fp.write(data)
+
+
+@contextmanager
+def open_atomic(path, mode=0o644):
+    """File object replacing path once the block exits without error."""
+
+    directory = os.path.dirname(path)
+    makedirs(directory)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+
+    # NOTE: BaseException, a closed generator writing here leaves no file
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            yield fp
+
+        os.chmod(temp_path, mode)
+        os.rename(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -4,77 +4,392 @@ from __future__ import unicode_literals
 
 import logging
 import multiprocessing
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty, Full
+from urlparse import urlparse
 
 from dinase.sugar.func import unzip
-from dinase.sugar.dict import iteritems, iterkeys
+from dinase.sugar.dict import iterkeys
 from dinase.sugar.exc import pickleble_exc_info, format_exception
 
-from .config import PROCESS_COUNT, feeds
-from .model import Heads, Entries
-from .feedlib import parse
+from .config import (
+    PROCESS_COUNT,
+    FETCH_CONCURRENCY,
+    FETCH_PER_HOST,
+    STORE_CONCURRENCY,
+    QUEUE_SIZE,
+    UPDATE_TIMEOUT,
+    REDIRECTS,
+    feeds,
+)
+from .model import Heads, Entries, Backlog, Redirects
+from .feedlib import fetch, parse_body, fix_entry, content, NotModified
 
 
 def update(names=None, callback=None):
     tasks = _select_tasks(names)
+    pipeline = _Pipeline(UPDATE_TIMEOUT)
+    done = []
 
-    for name, success, result in _get_feeds(tasks, PROCESS_COUNT):
-        if success:
-            head, entries = result
-            Heads.save(head, name)
-            info = Entries.save(entries, name)
-
-        else:
-            exc_type, exc_value, exc_traceback = result
-            exc_msg_full = "".join(format_exception(exc_type, exc_value, exc_traceback))
-            exc_msg_short = "".join(format_exception(exc_type, exc_value)).strip()
-            logging.error("cannot get feed: {}".format(name))
-            logging.debug(exc_msg_full)
-            info = exc_msg_short
+    for name, success, info in pipeline.run(tasks):
+        done.append(name)
 
         if callback:
             callback(name, success, info)
 
+    Backlog.discard(done)
+
+    if len(done) < len(tasks):
+        undone = [name for name in unzip(tasks)[0] if name not in done]
+        logging.error("updater deadline, carried over: {}".format(", ".join(undone)))
+        Backlog.add(undone)
+
+    Entries.expire_cache()
+    Entries.classify()
+
+    stats = pipeline.get_stats()
+
+    for stage in stats:
+        logging.info("updater {name}: {count} done, {throughput:.2f}/s, "
+                     "queue depth max {max_depth}, {errors} failed, "
+                     "{dropped} dropped".format(**stage))
+
+    return stats
+
 
 def _select_tasks(names=None):
     if names is None:
         names = list(iterkeys(feeds))
 
+    backlog = Backlog.get()
+    names = [name for name in backlog if name in names] + \
+        [name for name in names if name not in backlog]
+
     result = []
 
-    for name, feed in iteritems(feeds):
-        if name not in names or feed["disable"]:
+    for name in names:
+        feed = feeds.get(name)
+
+        if feed is None or feed["disable"]:
             continue
 
-        result.append((name, feed["url"]))
+        result.append((name, feed["url"], Heads.get_validators(name)))
 
     return result
 
 
-def _get_feeds(tasks, processes):
-    pool = multiprocessing.Pool(processes=min(processes, len(tasks)))
-    it = pool.imap_unordered(_get_feed, tasks)
-    done = []
+class _HostLimiter(object):
+
+    def __init__(self, limit):
+        super(_HostLimiter, self).__init__()
+
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url):
+        host = urlparse(url).netloc
+
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self._limit)
+
+            return self._semaphores[host]
+
+
+class _Stage(object):
+
+    _poll_interval = 0.5
+
+    def __init__(self, name, function, workers, maxsize=0, drain=False, on_error=None):
+        super(_Stage, self).__init__()
+
+        self.name = name
+        self._function = function
+        self._on_error = on_error
+        self._workers = workers
+        self._queue = Queue(maxsize)
+        self._drain = drain
+        self._stop = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._count = 0
+        self._busy = 0.0
+        self._max_depth = 0
+        self._errors = 0
+        self._dropped = 0
+
+    def start(self, stop):
+        self._stop = stop
+
+        for _ in range(self._workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put(item, timeout=self._poll_interval)
+                break
+            except Full:
+                if not self.is_alive():
+                    return False
+
+        depth = self._queue.qsize()
+
+        with self._lock:
+            self._max_depth = max(self._max_depth, depth)
+
+        return True
+
+    def discard(self, item):
+        """Count an item given up on because the stage was stopped."""
+
+        logging.warning("updater {} stopped, dropped: {}".format(self.name, item[0]))
+
+        with self._lock:
+            self._dropped += 1
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def get_stats(self, elapsed):
+        with self._lock:
+            return {
+                "name": self.name,
+                "workers": self._workers,
+                "count": self._count,
+                "busy": self._busy,
+                "throughput": self._count / elapsed if elapsed else 0.0,
+                "depth": self._queue.qsize(),
+                "max_depth": self._max_depth,
+                "errors": self._errors,
+                "dropped": self._dropped,
+            }
+
+    def _work(self):
+        while not (self._stop.is_set() and not self._drain):
+            try:
+                item = self._queue.get(timeout=self._poll_interval)
+            except Empty:
+                if self._stop.is_set():
+                    break
+
+                continue
+
+            started = time.time()
+            failed = False
+
+            # NOTE: a failed item must not take its worker down with it
+            try:
+                self._function(item)
+            except Exception:  # pylint: disable=W0703
+                logging.exception("updater {} failed: {}".format(self.name, item[0]))
+                failed = True
+
+                if self._on_error:
+                    self._on_error(item, pickleble_exc_info())
+
+            with self._lock:
+                self._count += 1
+                self._errors += failed
+                self._busy += time.time() - started
+
+
+class _Pipeline(object):
+
+    def __init__(self, timeouts):
+        super(_Pipeline, self).__init__()
+
+        self._timeouts = timeouts
+        self._limiter = _HostLimiter(FETCH_PER_HOST)
+        self._results = Queue()
+        self._stop = threading.Event()
+        self._parsers = None
+        self._resolver = None
+        self._fetch_stage = None
+        self._parse_stage = None
+        self._store_stage = None
+        self._started = None
+        self._finished = None
+
+    def run(self, tasks):
+        if not tasks:
+            return
+
+        self._started = time.time()
+        deadline = self._started + self._timeouts["DEADLINE"]
+
+        # NOTE: fork parsers before any stage thread is started
+        self._parsers = multiprocessing.Pool(processes=min(PROCESS_COUNT, len(tasks)))
+        self._resolver = ThreadPool(processes=REDIRECTS["CONCURRENCY"])
+
+        self._fetch_stage = _Stage("fetch", self._fetch,
+                                   min(FETCH_CONCURRENCY, len(tasks)),
+                                   on_error=self._on_error)
+        self._parse_stage = _Stage("parse", self._parse,
+                                   min(PROCESS_COUNT, len(tasks)),
+                                   maxsize=QUEUE_SIZE, on_error=self._on_error)
+        self._store_stage = _Stage("store", self._store,
+                                   min(STORE_CONCURRENCY, len(tasks)),
+                                   maxsize=QUEUE_SIZE, drain=True,
+                                   on_error=self._on_error)
+
+        for stage in (self._store_stage, self._parse_stage, self._fetch_stage):
+            stage.start(self._stop)
+
+        for task in tasks:
+            self._fetch_stage.put(task)
+
+        try:
+            for _ in tasks:
+                try:
+                    yield self._results.get(timeout=max(deadline - time.time(), 0))
+                except Empty:
+                    break
+
+            # NOTE: stop fetching and parsing, but save everything parsed
+            self._stop.set()
+            self._store_stage.join()
+
+            while not self._results.empty():
+                yield self._results.get_nowait()
+
+        finally:
+            self._stop.set()
+            self._finished = time.time()
+            self._parsers.terminate()
+            self._resolver.terminate()
+            self._parsers.join()
+            self._resolver.join()
+
+    def get_stats(self):
+        if self._started is None:
+            return []
+
+        elapsed = (self._finished or time.time()) - self._started
+
+        return [stage.get_stats(elapsed)
+                for stage in (self._fetch_stage, self._parse_stage, self._store_stage)]
+
+    def _fetch(self, task):
+        name, url, validators = task
+
+        try:
+            with self._limiter(url):
+                body, validators = fetch(url, validators,
+                                         connect_timeout=self._timeouts["CONNECT"],
+                                         timeout=self._timeouts["TOTAL"])
+        except NotModified:
+            self._results.put((name, True, "not modified"))
+        except Exception:  # pylint: disable=W0703
+            self._results.put(_failure(name, pickleble_exc_info()))
+        else:
+            task = (name, body, validators)
+
+            if self._stop.is_set() or not self._parse_stage.put(task):
+                self._parse_stage.discard(task)
+
+    def _parse(self, task):
+        async_result = self._parsers.apply_async(_parse_feed, (task, ))
 
-    try:
         while True:
-            name, success, result = it.next(timeout=90)
-            done.append(name)
-            yield name, success, result
+            try:
+                name, success, result = async_result.get(timeout=1)
+                break
+            except multiprocessing.TimeoutError:
+                if self._stop.is_set():
+                    self._parse_stage.discard(task)
+                    return
+
+        if not success:
+            self._results.put(_failure(name, result))
 
-    except multiprocessing.TimeoutError:
-        names, _ = unzip(tasks)
-        undone = [name for name in names if name not in done]
-        logging.error("updater timeout: {}".format(", ".join(undone)))
+        elif self._stop.is_set() or not self._store_stage.put((name, ) + result):
+            self._store_stage.discard((name, ) + result)
 
-    finally:
-        pool.terminate()
-        pool.join()
+    def _store(self, task):
+        name, head, entries, validators = task
 
+        try:
+            locations = self._resolve_redirects(entries)
 
-def _get_feed(task):
+            for entry in entries:
+                if entry["_fixed"]:
+                    content.clean_links(entry["_fixed"], resolve=locations.get)
+
+            # NOTE: validators go last, a failed save must not turn into
+            # "not modified" on the next run
+            Heads.save(head, name)
+            count = Entries.save(entries, name, head)
+            Heads.save(head, name, validators)
+        except Exception:  # pylint: disable=W0703
+            self._results.put(_failure(name, pickleble_exc_info()))
+        else:
+            self._results.put((name, True, count))
+
+    def _on_error(self, item, exc_info):
+        self._results.put(_failure(item[0], exc_info))
+
+    def _resolve_redirects(self, entries):
+        urls = set()
+
+        for entry in entries:
+            if entry["_fixed"]:
+                urls.update(content.get_redirectors(entry["_fixed"]))
+
+        locations = Redirects.get_many(urls)
+        missing = [url for url in urls if url not in locations]
+
+        if missing:
+            resolved = {url: location for url, location
+                        in zip(missing, self._resolver.map(_get_location, missing))
+                        if location}
+            Redirects.save(resolved)
+            locations.update(resolved)
+
+        return locations
+
+
+def _failure(name, exc_info):
+    exc_type, exc_value, exc_traceback = exc_info
+    exc_msg_full = "".join(format_exception(exc_type, exc_value, exc_traceback))
+    exc_msg_short = "".join(format_exception(exc_type, exc_value)).strip()
+    logging.error("cannot get feed: {}".format(name))
+    logging.debug(exc_msg_full)
+    return (name, False, exc_msg_short)
+
+
+def _get_location(url):
     try:
-        feed_name, url = task
-        feed, entries = parse(url)
-        return (feed_name, True, (feed, entries))
+        return content.url.get_location(url)
+    except Exception:  # pylint: disable=W0703
+        logging.debug("cannot resolve redirect: {}".format(url))
+        return None
+
+
+def _parse_feed(task):
+    feed_name, body, validators = task
+
+    try:
+        feed, entries = parse_body(body)
+
+        for entry in entries:
+            fixed_entry = fix_entry(entry, feed)
+
+            if fixed_entry:
+                content.clean_html(fixed_entry)
+
+            entry["_fixed"] = fixed_entry
+
+        return (feed_name, True, (feed, entries, validators))
     except Exception:  # pylint: disable=W0703
         return (feed_name, False, pickleble_exc_info())
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import uuid
+
+from dinase.sugar.dict import iterkeys
+from dinase.sugar.fs import write_atomic
+
+from .config import RENDER_CACHE, rubrics
+
+
+# NOTE: versions live on disk, so clients are answered without the database
+
+def bump(names):
+    for name in names:
+        write_atomic(_get_path(name), uuid.uuid4().hex.encode("ascii"))
+
+
+def bump_all():
+    bump(list(iterkeys(rubrics)))
+
+
+def get(name):
+    """Return the version of a rubric and the time it was set."""
+
+    try:
+        with open(_get_path(name), "rb") as fp:
+            return fp.read().decode("ascii"), os.fstat(fp.fileno()).st_mtime
+    except IOError:
+        bump([name])
+        return get(name)
+
+
+def _get_path(name):
+    return os.path.join(RENDER_CACHE["DIR"], "versions", name)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""WSGI application serving rubric feeds, ``?r=<rubric>`` as the CGI does.
+
+Config, rules and the database connection are loaded once per process;
+rendered documents of the current versions are kept in memory. Optional
+``since`` (xsd:dateTime), ``limit`` and ``before`` (a paging cursor) ask
+for a page of the feed instead, rendered per request.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+import urlparse
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+import trafaret as t
+from dateutil.tz import tzlocal
+
+from . import datelib
+from .config import RENDER_CACHE, rubrics
+from .feed import (
+    compress,
+    get_feed_version,
+    get_page,
+    parse_cursor,
+    read_cached_feed,
+    iter_cached_feed,
+)
+
+
+__all__ = ("application", "is_fresh", "serve")
+
+
+_query = t.Dict({
+    t.Key("r"): t.String,
+    t.Key("since", optional=True): t.String,
+    t.Key("before", optional=True): t.String,
+    t.Key("limit", optional=True): t.Int(gte=1),
+})
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def application(environ, start_response):
+    try:
+        args = _query.check(dict(urlparse.parse_qsl(environ.get("QUERY_STRING", ""))))
+        page = _get_page_args(args)
+    except (t.DataError, ValueError):
+        return _respond(start_response, "400 Bad Request")
+
+    rubric = args["r"]
+
+    if rubric not in rubrics:
+        return _respond(start_response, "404 Not Found")
+
+    encoding = "gzip" if _accepts_gzip(environ.get("HTTP_ACCEPT_ENCODING")) else None
+
+    try:
+        tag, mtime = get_feed_version(rubric)
+        headers = [
+            (b"ETag", b"\"{}\"".format(_get_etag(tag, encoding))),
+            (b"Last-Modified", formatdate(mtime, usegmt=True).encode("ascii")),
+            (b"Cache-Control", b"max-age={}".format(RENDER_CACHE["MAX_AGE"])),
+            (b"Vary", b"Accept-Encoding"),
+        ]
+
+        if is_fresh(environ, tag, mtime):
+            start_response(b"304 Not Modified", headers)
+            return []
+
+        if page is None:
+            xml = _get_document(rubric, tag, encoding)
+
+        else:
+            xml = get_page(rubric, **page)
+
+            if encoding is not None:
+                xml = compress(xml)
+    except Exception:  # pylint: disable=W0703
+        logging.exception("cannot serve rubric: {}".format(rubric))
+        return _respond(start_response, "500 Internal Server Error")
+
+    headers.append((b"Content-Type", b"application/atom+xml;charset=utf-8"))
+
+    if encoding is not None:
+        headers.append((b"Content-Encoding", encoding.encode("ascii")))
+
+    if xml is None:
+        # NOTE: not rendered yet, the document goes out while it is rendered
+        start_response(b"200 OK", headers)
+        return iter_cached_feed(rubric, tag, encoding)
+
+    start_response(b"200 OK", headers + [(b"Content-Length", b"{}".format(len(xml)))])
+
+    return [xml]
+
+
+def is_fresh(environ, tag, mtime):
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+
+    # NOTE: If-Modified-Since is ignored when If-None-Match is sent
+    if if_none_match is not None:
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+
+            if candidate == "*" or candidate.strip("\"") in (tag, _get_etag(tag, "gzip")):
+                return True
+
+        return False
+
+    if_modified_since = environ.get("HTTP_IF_MODIFIED_SINCE")
+
+    if if_modified_since:
+        parsed = parsedate_tz(if_modified_since)
+
+        if parsed is not None:
+            return int(mtime) <= mktime_tz(parsed)
+
+    return False
+
+
+def serve(host="127.0.0.1", port=8000):
+    """Run a development server, one request at a time."""
+
+    from wsgiref.simple_server import make_server
+
+    server = make_server(host, port, application)
+    logging.warning("serving on http://{}:{}/".format(host, port))
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def _get_document(rubric, tag, encoding):
+    with _documents_lock:
+        cached = _documents.get((rubric, encoding))
+
+    if cached is not None and cached[0] == tag:
+        return cached[1]
+
+    xml = read_cached_feed(rubric, tag, encoding)
+
+    if xml is not None:
+        with _documents_lock:
+            _documents[(rubric, encoding)] = (tag, xml)
+
+    return xml
+
+
+def _get_page_args(args):
+    if not any(key in args for key in ("since", "before", "limit")):
+        return None
+
+    page = {"limit": args.get("limit")}
+
+    if "since" in args:
+        since = datelib.xsd.parse(args["since"])
+        page["since"] = since.astimezone(tzlocal()).replace(tzinfo=None)
+
+    if "before" in args:
+        page["before"] = parse_cursor(args["before"])
+
+    return page
+
+
+def _get_etag(tag, encoding):
+    # NOTE: representations of other encodings need their own entity tags
+    return tag if encoding is None else "{}-{}".format(tag, encoding)
+
+
+def _accepts_gzip(accept_encoding):
+    if not accept_encoding:
+        return False
+
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+
+        if name.strip().lower() not in ("gzip", "x-gzip"):
+            continue
+
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+
+        return True
+
+    return False
+
+
+def _respond(start_response, status):
+    body = status.encode("ascii")
+    start_response(status.encode("ascii"), [
+        (b"Content-Type", b"text/plain;charset=utf-8"),
+        (b"Content-Length", b"{}".format(len(body))),
+    ])
+
+    return [body]
@@ -3,16 +3,71 @@
 import os
 
 
+# ENGINE is "mongodb" or "sqlite"; PATH is the sqlite database file;
+# mongodb connections are pooled per process, timeouts in seconds
 DATABASE = {
+    "ENGINE": "mongodb",
+    "PATH": "/var/lib/dinase/dinase.sqlite",
     "NAME": "dinase",
     "HOST": "127.0.0.1",
     "PORT": 27017,
     "USERNAME": "",
-    "PASSWORD": ""
+    "PASSWORD": "",
+    "POOL_SIZE": 10,
+    "CONNECT_TIMEOUT": 5,
+    "SOCKET_TIMEOUT": 30,
 }
 
 LINK_MASK = "http://dinase.ru/cgi-bin/dinase/dinase.py?r={rubric}"
 
 JSON_DIR = os.path.dirname(__file__)
 
-PROCESS_COUNT = 10
+PROCESS_COUNT = 4
+
+FETCH_CONCURRENCY = 200
+FETCH_PER_HOST = 4
+
+STORE_CONCURRENCY = 4
+
+# bounded queues between the fetch, parse and store stages
+QUEUE_SIZE = 20
+
+# seconds; CONNECT and TOTAL are per feed, DEADLINE is for the whole run
+UPDATE_TIMEOUT = {
+    "CONNECT": 15,
+    "TOTAL": 60,
+    "DEADLINE": 600,
+}
+
+# feedburner/feedproxy links are resolved at update time and cached
+REDIRECTS = {
+    "TTL": 30 * 86400,
+    "CONCURRENCY": 20,
+}
+
+# rendered feeds and rubric versions; MAX_AGE is sent in Cache-Control,
+# GZIP_LEVEL is used once per rubric version
+RENDER_CACHE = {
+    "DIR": "/var/cache/dinase",
+    "MAX_AGE": 300,
+    "GZIP_LEVEL": 6,
+}
+
+# daemon mode; intervals in seconds, feeds.json may override
+# min_interval/max_interval per feed
+SCHEDULER = {
+    "MIN_INTERVAL": 300,
+    "MAX_INTERVAL": 21600,
+    "POLL_FACTOR": 0.5,
+    "SAMPLE_SIZE": 20,
+    "TRIM_INTERVAL": 86400,
+}
+
+# entries retention, enforced by cli.py --trim and by the daemon every
+# SCHEDULER TRIM_INTERVAL (0 disables it); MAX_AGE in seconds, 0
+# disables a limit; entries of PROTECT_RUBRICS are kept
+RETENTION = {
+    "MAX_AGE": 180 * 86400,
+    "MAX_PER_FEED": 1000,
+    "PROTECT_RUBRICS": [],
+}